@@ -68,11 +68,40 @@ load_image_url = _formatreader.load_using_bioformats_url
 get_image_reader = _formatreader.get_image_reader
 release_image_reader = _formatreader.release_image_reader
 clear_image_reader_cache = _formatreader.clear_image_reader_cache
+set_image_reader_cache_limits = _formatreader.set_image_reader_cache_limits
+get_image_reader_cache_stats = _formatreader.get_image_reader_cache_stats
+ImageReaderPool = _formatreader.ImageReaderPool
+ImageReaderPipeline = _formatreader.ImageReaderPipeline
+
+# Reader detection cache
+
+get_reader_detection_cache_stats = _formatreader.get_reader_detection_cache_stats
+clear_reader_detection_cache = _formatreader.clear_reader_detection_cache
+clear_binding_cache = _formatreader.clear_binding_cache
+
+# Reader memoization
+
+enable_memoizer = _formatreader.enable_memoizer
+disable_memoizer = _formatreader.disable_memoizer
+
+# URL download cache
+
+enable_download_cache = _formatreader.enable_download_cache
+disable_download_cache = _formatreader.disable_download_cache
+
+# Plane cache
+
+PlaneCache = _formatreader.PlaneCache
+set_plane_cache = _formatreader.set_plane_cache
+get_plane_cache = _formatreader.get_plane_cache
 
 # Metadata
 
 from .omexml import OMEXML
 get_omexml_metadata = _formatreader.get_omexml_metadata
+get_omexml_and_reader = _formatreader.get_omexml_and_reader
+enable_omexml_cache = _formatreader.enable_omexml_cache
+disable_omexml_cache = _formatreader.disable_omexml_cache
 
 # Writing images
 
@@ -0,0 +1,309 @@
+# Python-bioformats is distributed under the GNU General Public
+# License, but this file is licensed under the more permissive BSD
+# license.  See the accompanying file LICENSE for details.
+#
+# Copyright (c) 2009-2014 Broad Institute
+# All rights reserved.
+
+'''aio.py - read images from asyncio code without blocking the event loop
+
+Bio-Formats calls block for as long as it takes to decode a plane, so the
+coroutines here run them on a pool of threads that are attached to the
+Java VM once, when they start, and detached when the pool shuts down.
+The number of calls waiting for or running on the pool is bounded, so a
+burst of requests waits on the event loop rather than piling up in the
+pool's queue, and cancelling a coroutine drops its call if it has not
+started yet.
+
+Example:
+    import bioformats.aio
+
+    async def get_tile(path, x, y):
+        async with bioformats.aio.AsyncImageReader(path) as rdr:
+            return await rdr.read_tile(x, y, 256, 256, rescale=False)
+
+This module needs Python 3.5 or later. The Java VM must be started, with
+:func:`javabridge.start_vm`, before the coroutines are awaited.
+'''
+
+import asyncio
+import concurrent.futures
+import logging
+logger = logging.getLogger(__name__)
+import queue
+import threading
+import weakref
+
+import javabridge as jutil
+from . import formatreader
+from . import metadatatools
+
+DEFAULT_MAX_WORKERS = 4
+'''The default number of threads of a JVMThreadPool'''
+
+class JVMThreadPool(concurrent.futures.Executor):
+    '''An executor whose threads are attached to the Java VM
+
+    Each thread attaches to the Java VM when it starts and detaches when
+    the pool is shut down, rather than once per call.
+
+    max_workers - the number of threads
+
+    max_pending - the most calls that :meth:`run` lets wait for or run on
+                  the pool at once. Defaults to twice `max_workers`.
+    '''
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=None):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if max_pending is None:
+            max_pending = 2 * max_workers
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, 1)
+        self.__work = queue.Queue()
+        self.__threads = []
+        self.__shutdown = False
+        self.__lock = threading.Lock()
+        self.__semaphores = weakref.WeakKeyDictionary()
+
+    def __worker(self):
+        jutil.attach()
+        try:
+            while True:
+                item = self.__work.get()
+                if item is None:
+                    break
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            jutil.detach()
+
+    def submit(self, fn, *args, **kwargs):
+        '''Schedule fn(*args, **kwargs) to run on one of the pool's threads
+
+        Returns a :class:`concurrent.futures.Future` for the call.
+        '''
+        with self.__lock:
+            if self.__shutdown:
+                raise RuntimeError("Cannot submit to a pool that is shut down")
+            future = concurrent.futures.Future()
+            self.__work.put((future, fn, args, kwargs))
+            if len(self.__threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self.__worker,
+                    name="JVMThreadPool-%d" % len(self.__threads))
+                thread.daemon = True
+                thread.start()
+                self.__threads.append(thread)
+        return future
+
+    def shutdown(self, wait=True):
+        '''Stop the pool's threads once the calls submitted so far finish
+
+        wait - True to wait for the threads to finish and detach
+        '''
+        with self.__lock:
+            if self.__shutdown:
+                threads = []
+            else:
+                self.__shutdown = True
+                threads = list(self.__threads)
+                for _ in threads:
+                    self.__work.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __get_semaphore(self, loop):
+        with self.__lock:
+            semaphore = self.__semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_pending)
+                self.__semaphores[loop] = semaphore
+            return semaphore
+
+    async def run(self, fn, *args, **kwargs):
+        '''Run fn(*args, **kwargs) on the pool and return its result
+
+        Waits on the event loop while `max_pending` calls are already
+        waiting for or running on the pool. If the coroutine is
+        cancelled before the call starts, the call is dropped; a call
+        that has started runs to completion, since Java code cannot be
+        interrupted, and still counts toward `max_pending` until then.
+        '''
+        loop = asyncio.get_event_loop()
+        semaphore = self.__get_semaphore(loop)
+        await semaphore.acquire()
+        try:
+            future = self.submit(fn, *args, **kwargs)
+        except:
+            semaphore.release()
+            raise
+
+        def on_done(future):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The event loop is closed
+                pass
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+__pool = None
+__pool_lock = threading.Lock()
+
+def get_pool():
+    '''Get the JVMThreadPool that coroutines use by default
+
+    The pool is made with :data:`DEFAULT_MAX_WORKERS` threads the first
+    time it is needed.
+    '''
+    global __pool
+    with __pool_lock:
+        if __pool is None:
+            __pool = JVMThreadPool()
+        return __pool
+
+def shutdown_pool(wait=True):
+    '''Shut down the default JVMThreadPool, detaching its threads
+
+    Call this before killing the Java VM. A new pool is made if the
+    coroutines are used again.
+    '''
+    global __pool
+    with __pool_lock:
+        pool, __pool = __pool, None
+    if pool is not None:
+        pool.shutdown(wait)
+
+class AsyncImageReader(object):
+    '''Read an image file from coroutines
+
+    The arguments are those of :class:`bioformats.ImageReader`, plus:
+
+    pool - the :class:`JVMThreadPool` to run Bio-Formats calls on.
+           Defaults to the pool returned by :func:`get_pool`.
+
+    The reader is made when :meth:`open` is awaited, or on entry to an
+    ``async with`` block. Calls on one reader run one at a time, because a
+    Bio-Formats reader is not thread-safe; use several readers of the same
+    file to read it concurrently.
+    '''
+    def __init__(self, path=None, url=None, pool=None, **kwargs):
+        self.path = path
+        self.url = url
+        self.kwargs = kwargs
+        self.pool = pool
+        self.rdr = None
+        self.__lock = threading.Lock()
+        self.__async_lock = None
+
+    def __get_pool(self):
+        return self.pool if self.pool is not None else get_pool()
+
+    def __call(self, fn, *args, **kwargs):
+        #
+        # Take the lock on the pool's thread, so that a call that outlives
+        # a cancelled coroutine still keeps the next call waiting.
+        #
+        with self.__lock:
+            return fn(*args, **kwargs)
+
+    async def __run(self, fn, *args, **kwargs):
+        #
+        # Queue one call at a time, so that calls waiting for this reader
+        # wait on the event loop instead of holding the pool's threads.
+        #
+        if self.__async_lock is None:
+            self.__async_lock = asyncio.Lock()
+        async with self.__async_lock:
+            return await self.__get_pool().run(
+                self.__call, fn, *args, **kwargs)
+
+    def __open(self):
+        if self.rdr is None:
+            self.rdr = formatreader.ImageReader(
+                path=self.path, url=self.url, **self.kwargs)
+        return self
+
+    async def open(self):
+        '''Make the ImageReader, detecting the file's format
+
+        Returns this AsyncImageReader.
+        '''
+        return await self.__run(self.__open)
+
+    def __read(self, kwargs):
+        self.__open()
+        return self.rdr.read(**kwargs)
+
+    async def read(self, **kwargs):
+        '''Read a plane of the image
+
+        The keyword arguments are those of :meth:`bioformats.ImageReader.read`.
+        '''
+        return await self.__run(self.__read, kwargs)
+
+    async def read_tile(self, x, y, width, height, **kwargs):
+        '''Read a tile of a plane of the image
+
+        x, y - the coordinates of the tile's top left corner
+
+        width, height - the size of the tile
+
+        The other keyword arguments are those of
+        :meth:`bioformats.ImageReader.read`.
+        '''
+        kwargs["XYWH"] = (x, y, width, height)
+        return await self.read(**kwargs)
+
+    def __get_omexml_metadata(self):
+        self.__open()
+        if self.rdr.metadata is None:
+            raise ValueError("The reader has no OME-XML metadata store")
+        return metadatatools.getOMEXML(self.rdr.metadata)
+
+    async def get_omexml_metadata(self):
+        '''Get the OME-XML metadata that the reader parsed when it opened the file
+
+        Returns the metadata as a string of XML, made from the reader's
+        metadata store without opening the file again, as for
+        :meth:`bioformats.ImageReader.get_omexml`. Raises ValueError if the
+        reader was made with ``omexml_metadata=False``.
+        '''
+        return await self.__run(self.__get_omexml_metadata)
+
+    def __close(self):
+        if self.rdr is not None:
+            self.rdr.close()
+            self.rdr = None
+
+    async def close(self):
+        '''Close the ImageReader'''
+        await self.__run(self.__close)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+async def read_image(path=None, url=None, pool=None, **kwargs):
+    '''Read a plane of an image file from a coroutine
+
+    path, url - the file to read, as for :class:`bioformats.ImageReader`
+
+    pool - the :class:`JVMThreadPool` to read on, as for
+           :class:`AsyncImageReader`
+
+    The other keyword arguments are those of
+    :meth:`bioformats.ImageReader.read`.
+    '''
+    async with AsyncImageReader(path=path, url=url, pool=pool) as rdr:
+        return await rdr.read(**kwargs)
@@ -28,26 +28,39 @@ __version__ = "$Revision$"
 
 import logging
 logger = logging.getLogger(__name__)
+import collections
 import errno
+import functools
+import hashlib
+import json
+import numbers
 import numpy as np
 import os
 import sys
 
 if sys.version_info.major == 3:
-    from urllib.request import urlopen, urlparse, url2pathname
+    from urllib.request import urlopen, urlparse, url2pathname, Request
     from urllib.parse import unquote
+    from urllib.error import HTTPError
+    import queue
 else:
     from urllib import url2pathname
-    from urllib2 import urlopen, urlparse, unquote
+    from urllib2 import urlopen, urlparse, unquote, Request, HTTPError
     urlparse = urlparse.urlparse
+    import Queue as queue
 
 import shutil
+import struct
 import tempfile
+import threading
+import time
 import traceback
+import uuid
 
 import javabridge as jutil
 import bioformats
 from . import metadatatools as metadatatools
+from .omexml import OMEXML
 import javabridge as javabridge
 
 K_OMERO_SERVER = "omero_server"
@@ -58,6 +71,69 @@ K_OMERO_CONFIG_FILE = "omero_config_file"
 '''The cleartext password - only used if password is provided on command-line'''
 K_OMERO_PASSWORD = "omero_password"
 
+###################
+#
+# The binding registry
+#
+# The make_*_class functions build Python classes that bind Java classes,
+# looking up Java classes and static fields as they go. The registry keeps
+# what they build for as long as the Java VM that it was built for runs.
+#
+###################
+
+__bindings = {}
+__bindings_vm = None
+
+def get_vm_token():
+    '''Get an object that identifies the running Java VM
+
+    Returns None if the VM is not running. javabridge starts each VM on
+    a new monitor thread, so the thread identifies the VM.
+    '''
+    if not javabridge._javabridge.get_vm().is_active():
+        return None
+    return getattr(javabridge.jutil, "__start_thread", True)
+
+def get_binding(key, factory):
+    '''Get a binding from the registry, building it if needed
+
+    key - the binding's key in the registry
+
+    factory - a function that builds the binding
+
+    The registry is emptied when the Java VM is not running or is not the
+    one that the bindings were built for. Bindings are not registered
+    while the VM is not running.
+    '''
+    global __bindings_vm
+    vm_token = get_vm_token()
+    if vm_token is not __bindings_vm:
+        __bindings.clear()
+        __bindings_vm = vm_token
+    if vm_token is None:
+        return factory()
+    binding = __bindings.get(key)
+    if binding is None:
+        binding = factory()
+        __bindings[key] = binding
+    return binding
+
+def clear_binding_cache():
+    '''Forget all bindings, so that they are built again when next needed'''
+    __bindings.clear()
+
+def cached_binding(fn):
+    '''Decorate a function that builds a binding so that it's built once
+
+    The binding is registered under the function's name and arguments.
+    '''
+    @functools.wraps(fn)
+    def get_cached_binding(*args):
+        return get_binding((fn.__module__, fn.__name__) + args,
+                           lambda: fn(*args))
+    return get_cached_binding
+
+@cached_binding
 def make_format_tools_class():
     '''Get a wrapper for the loci/formats/FormatTools class
 
@@ -89,6 +165,7 @@ def make_format_tools_class():
 
     return FormatTools
 
+@cached_binding
 def make_iformat_reader_class():
     '''Bind a Java class that implements IFormatReader to a Python class
 
@@ -103,6 +180,13 @@ def make_iformat_reader_class():
         '''
         close = jutil.make_method('close','()V',
                                   'Close the currently open file and free memory')
+        closeFile = jutil.make_method(
+            'close', '(Z)V',
+            'Close the currently open file. If fileOnly is true, keep the '
+            'reader\'s state so that reopenFile can reopen the file')
+        reopenFile = jutil.make_method(
+            'reopenFile', '()V',
+            'Reopen a file closed by close(true)')
         getDimensionOrder = jutil.make_method('getDimensionOrder',
                                               '()Ljava/lang/String;',
                                               'Return the dimension order as a five-character string, e.g. "XYCZT"')
@@ -157,7 +241,43 @@ def make_iformat_reader_class():
                                           no - image plane number
                                           x,y - offset into image
                                           w,h - dimensions of image to return''')
+        openBytesBuffer = jutil.make_method('openBytes', '(I[B)[B',
+                                            '''Read the specified image plane into a byte array
+
+                                            (corresponds to openBytes(int no, byte [] buf))
+                                            no - image plane number
+                                            buf - a byte array large enough to hold the plane.
+                                            Returns the filled buffer.''')
+        openBytesBufferXYWH = jutil.make_method('openBytes', '(I[BIIII)[B',
+                                                '''Read part of the specified image plane into a byte array
+
+                                                (corresponds to openBytes(int no, byte [] buf, int x, int y, int w, int h))
+                                                no - image plane number
+                                                buf - a byte array large enough to hold the region
+                                                x,y - offset into image
+                                                w,h - dimensions of image to return''')
+        getOptimalTileWidth = jutil.make_method(
+            'getOptimalTileWidth', '()I',
+            'Get the width of the tiles that the file is stored in')
+        getOptimalTileHeight = jutil.make_method(
+            'getOptimalTileHeight', '()I',
+            'Get the height of the tiles that the file is stored in')
         setSeries = jutil.make_method('setSeries','(I)V','Set the currently selected image series')
+        getResolutionCount = jutil.make_method(
+            'getResolutionCount', '()I',
+            'Return the # of resolution levels of the current series')
+        getResolution = jutil.make_method(
+            'getResolution', '()I',
+            'Return the currently selected resolution level (0 = full resolution)')
+        setResolution = jutil.make_method(
+            'setResolution', '(I)V',
+            'Set the currently selected resolution level (0 = full resolution)')
+        setFlattenedResolutions = jutil.make_method(
+            'setFlattenedResolutions', '(Z)V',
+            '''Set whether resolution levels are presented as separate series
+
+            Must be called before setId. Resolution levels can only be
+            selected with setResolution if this is False.''')
         setGroupFiles = jutil.make_method('setGroupFiles', '(Z)V',
                                           'Force reader to group or not to group files in a multi-file set')
         setMetadataStore = jutil.make_method('setMetadataStore',
@@ -232,8 +352,13 @@ def make_iformat_reader_class():
 
     return IFormatReader
 
+@cached_binding
 def get_class_list():
-    '''Return a wrapped instance of loci.formats.ClassList'''
+    '''Return a wrapped instance of loci.formats.ClassList
+
+    The class list is built once per Java VM and shared, so changes made
+    to it affect all readers made later.
+    '''
     #
     # This uses the reader.txt file from inside the loci_tools.jar
     #
@@ -277,6 +402,7 @@ def get_class_list():
     return ClassList()
 
 
+@cached_binding
 def make_image_reader_class():
     '''Return an image reader class for the given Java environment'''
     env = jutil.get_env()
@@ -310,7 +436,7 @@ def make_image_reader_class():
                     if m.getName() in ('allowOpenToCheckType', 'setAllowOpenFiles'):
                         self.allowOpenToCheckType_method = m
             if self.allowOpenToCheckType_method is not None:
-                object_class = env.find_class('java/lang/Object')
+                object_class = jutil.get_env().find_class('java/lang/Object')
                 jexception = jutil.get_env().exception_occurred()
                 if jexception is not None:
                     raise jutil.JavaException(jexception)
@@ -329,6 +455,7 @@ def make_image_reader_class():
     return ImageReader
 
 
+@cached_binding
 def make_reader_wrapper_class(class_name):
     '''Make an ImageReader wrapper class
 
@@ -522,6 +649,273 @@ def get_omero_reader():
     return rdr
 
 
+###################
+#
+# A cache mechanism for reader detection
+#
+# Finding the reader for a file means instantiating every reader in the
+# class list and asking each whether it can read the file, up to three
+# times. Batches typically open many files of the same kind, so we remember
+# which reader class claimed a file with a given suffix and leading bytes
+# and try that class first the next time we see the same combination.
+#
+###################
+
+'''# of leading bytes of a file that are used to identify its type.
+
+Most formats are identified by a magic number in their first few bytes.
+TIFF stores the offset of its first IFD right after its magic number, so
+making this longer will cause files from the same source to miss the cache.
+'''
+DETECTION_SIGNATURE_LENGTH = 4
+
+__reader_class_cache = {}
+__reader_class_cache_hits = 0
+__reader_class_cache_misses = 0
+__reader_class_cache_hit_instances = 0
+__reader_class_cache_lock = threading.Lock()
+
+find_rdr_script = """
+var classes = class_list.getClasses();
+var rdr = null;
+var lc_filename = java.lang.String(filename.toLowerCase());
+for (pass=0; pass < 3; pass++) {
+    for (class_idx in classes) {
+        var maybe_rdr = classes[class_idx].newInstance();
+        if (pass == 0) {
+            if (maybe_rdr.isThisType(filename, false)) {
+                rdr = maybe_rdr;
+                break;
+            }
+            continue;
+        } else if (pass == 1) {
+            var suffixes = maybe_rdr.getSuffixes();
+            var suffix_found = false;
+            for (suffix_idx in suffixes) {
+                var suffix = java.lang.String(suffixes[suffix_idx]);
+                suffix = suffix.toLowerCase();
+                if (lc_filename.endsWith(suffix)) {
+                    suffix_found = true;
+                    break;
+                }
+            }
+            if (! suffix_found) continue;
+        }
+        if (maybe_rdr.isThisType(stream)) {
+            rdr = maybe_rdr;
+            break;
+        }
+    }
+    if (rdr) break;
+}
+rdr;
+"""
+
+#
+# A cached reader class is only right for a file if no class before it in
+# the class list would have claimed the file during the scan above. The
+# classes before it that declare a suffix that files with the cached
+# suffix can end in are found once, when the class is cached, and only
+# they are instantiated and probed again; if one of them claims the file,
+# the script returns null and the caller falls back to the scan.
+#
+validate_rdr_script = """
+var classes = class_list.getClasses();
+var rival_set = new java.util.HashSet(java.util.Arrays.asList(
+    java.lang.String(rival_names).split(",")));
+var rdr = null;
+var lc_filename = java.lang.String(filename.toLowerCase());
+for (class_idx in classes) {
+    var name = classes[class_idx].getName();
+    if (name.equals(class_name)) {
+        var maybe_rdr = classes[class_idx].newInstance();
+        if (maybe_rdr.isThisType(filename, false) ||
+            maybe_rdr.isThisType(stream)) {
+            rdr = maybe_rdr;
+        }
+        break;
+    }
+    if (! rival_set.contains(name)) continue;
+    var maybe_rdr = classes[class_idx].newInstance();
+    var suffixes = maybe_rdr.getSuffixes();
+    var suffix_found = false;
+    for (suffix_idx in suffixes) {
+        var suffix = java.lang.String(suffixes[suffix_idx]);
+        suffix = suffix.toLowerCase();
+        if (lc_filename.endsWith(suffix)) {
+            suffix_found = true;
+            break;
+        }
+    }
+    if (suffix_found && (maybe_rdr.isThisType(filename, false) ||
+                         maybe_rdr.isThisType(stream))) {
+        break;
+    }
+}
+rdr;
+"""
+
+#
+# The scan found a reader by the file's name or suffix, rather than by
+# probing the contents with every reader - only then can the result be
+# checked by validate_rdr_script.
+#
+is_cacheable_rdr_script = """
+var cacheable = rdr.isThisType(filename, false);
+var suffixes = rdr.getSuffixes();
+var lc_filename = java.lang.String(filename.toLowerCase());
+for (suffix_idx in suffixes) {
+    var suffix = java.lang.String(suffixes[suffix_idx]);
+    if (lc_filename.endsWith(suffix.toLowerCase())) {
+        cacheable = true;
+        break;
+    }
+}
+java.lang.Boolean(cacheable);
+"""
+
+#
+# Get the comma-separated names of the classes before the cached one that
+# declare a suffix that some file with the detection key's suffix ends in:
+# a suffix of the key's suffix, or a longer suffix ending in "." and the
+# key's suffix. All the classes before it are taken if the key has no
+# suffix.
+#
+get_rival_names_script = """
+var classes = class_list.getClasses();
+var key_suffix = java.lang.String(suffix);
+var dotted_suffix = java.lang.String("." + suffix);
+var names = new java.lang.StringBuilder();
+for (class_idx in classes) {
+    var name = classes[class_idx].getName();
+    if (name.equals(class_name)) break;
+    var suffixes = classes[class_idx].newInstance().getSuffixes();
+    for (suffix_idx in suffixes) {
+        var s = java.lang.String(suffixes[suffix_idx]).toLowerCase();
+        var matches = key_suffix.length() == 0 ||
+            key_suffix.endsWith(s) || s.endsWith(dotted_suffix);
+        if (matches) {
+            if (names.length() > 0) names.append(",");
+            names.append(name);
+            break;
+        }
+    }
+}
+names.toString();
+"""
+
+def get_detection_key(filename, stream):
+    '''Get the key used to look up a file's reader class in the detection cache
+
+    filename - the name of the file, used for its suffix
+
+    stream - a loci.common.RandomAccessInputStream on the file's contents.
+             The stream is rewound after reading the signature.
+
+    The key is the lower-case suffix (including an ".ome" part, so that
+    OME-TIFF is kept apart from TIFF) and the file's leading bytes.
+    '''
+    parts = filename.lower().rsplit(".", 2)
+    if len(parts) == 3 and parts[1] == "ome":
+        suffix = "ome." + parts[2]
+    elif len(parts) > 1:
+        suffix = parts[-1]
+    else:
+        suffix = ""
+    env = jutil.get_env()
+    jbuffer = env.make_byte_array(
+        np.zeros(DETECTION_SIGNATURE_LENGTH, np.uint8))
+    n_read = jutil.call(stream, 'read', '([B)I', jbuffer)
+    jutil.call(stream, 'seek', '(J)V', 0)
+    signature = env.get_byte_array_elements(jbuffer)[:max(n_read, 0)]
+    return suffix, signature.tobytes()
+
+def find_reader(filename, stream):
+    '''Find a Bio-Formats reader that can read a file
+
+    filename - the name of the file
+
+    stream - a loci.common.RandomAccessInputStream on the file's contents
+
+    Returns an instance of the Java reader class or None if no reader
+    claims the file. The reader class found for the file's suffix and
+    signature is tried first, falling back to a scan of all readers. The
+    cached class is only used if the classes before it in the class list
+    that declare the file's suffix don't claim the file, so the result is
+    the one the scan would give; those classes are remembered with the
+    cached class, so a hit instantiates only them and the cached class.
+    Readers that the scan only found by probing the file's contents with
+    readers of other suffixes aren't cached.
+    '''
+    global __reader_class_cache_hits, __reader_class_cache_misses, \
+           __reader_class_cache_hit_instances
+    key = get_detection_key(filename, stream)
+    with __reader_class_cache_lock:
+        cached = __reader_class_cache.get(key)
+    if cached is not None:
+        class_name, rival_names = cached
+        jrdr = jutil.run_script(validate_rdr_script,
+                                dict(class_list = get_class_list(),
+                                     class_name = class_name,
+                                     rival_names = ",".join(rival_names),
+                                     filename = filename,
+                                     stream = stream))
+        jutil.call(stream, 'seek', '(J)V', 0)
+        if jrdr is not None:
+            with __reader_class_cache_lock:
+                __reader_class_cache_hits += 1
+                __reader_class_cache_hit_instances += len(rival_names) + 1
+            return jrdr
+        with __reader_class_cache_lock:
+            __reader_class_cache.pop(key, None)
+    with __reader_class_cache_lock:
+        __reader_class_cache_misses += 1
+    jrdr = jutil.run_script(find_rdr_script, dict(class_list = get_class_list(),
+                                                  filename = filename,
+                                                  stream = stream))
+    if jrdr is not None:
+        jutil.call(stream, 'seek', '(J)V', 0)
+        cacheable = jutil.run_script(is_cacheable_rdr_script,
+                                     dict(rdr = jrdr, filename = filename))
+        if cacheable:
+            rdr = make_iformat_reader_class()()
+            rdr.o = jrdr
+            class_name = rdr.get_class_name()
+            rival_names = jutil.run_script(
+                get_rival_names_script, dict(class_list = get_class_list(),
+                                             class_name = class_name,
+                                             suffix = key[0]))
+            rival_names = tuple([name for name in rival_names.split(",")
+                                 if len(name) > 0])
+            with __reader_class_cache_lock:
+                __reader_class_cache[key] = (class_name, rival_names)
+    return jrdr
+
+def get_reader_detection_cache_stats():
+    '''Return statistics for the cache of detected reader classes
+
+    :returns: a dictionary with the number of `hits` (files whose cached
+              reader class accepted them), `misses` (files that needed a
+              scan of all readers), `hit_instances` (readers instantiated
+              to check the cached classes on hits) and `size` (# of cached
+              classes).
+    '''
+    with __reader_class_cache_lock:
+        return dict(hits = __reader_class_cache_hits,
+                    misses = __reader_class_cache_misses,
+                    hit_instances = __reader_class_cache_hit_instances,
+                    size = len(__reader_class_cache))
+
+def clear_reader_detection_cache():
+    '''Forget the detected reader classes and reset the statistics'''
+    global __reader_class_cache_hits, __reader_class_cache_misses, \
+           __reader_class_cache_hit_instances
+    with __reader_class_cache_lock:
+        __reader_class_cache.clear()
+        __reader_class_cache_hits = 0
+        __reader_class_cache_misses = 0
+        __reader_class_cache_hit_instances = 0
+
 def load_using_bioformats_url(url, c=None, z=0, t=0, series=None, index=None,
                           rescale = True,
                           wants_max_intensity = False,
@@ -534,6 +928,962 @@ def load_using_bioformats_url(url, c=None, z=0, t=0, series=None, index=None,
                         channel_names)
 
 
+class DiskCache(object):
+    '''A directory of cached files, evicted least recently used first
+
+    Each entry is a data file and a JSON file of metadata about it, both
+    named after a hash of the entry's key and ending in ".data" and
+    ".metadata". Reading an entry marks it used
+    by updating its data file's modification time.
+
+    The cache keeps a running total of the bytes it has stored, counted
+    from the directory's contents at the first eviction, and only scans
+    the directory for entries to evict when the total is over max_bytes.
+
+    Data files that are marked in use, with :meth:`acquire`, are not
+    evicted. If their entry is removed or replaced while they are in use,
+    they are deleted when the last user calls :meth:`release`. The cache
+    can be used from several threads.
+
+    directory - the directory to keep the files in
+
+    max_bytes - the most bytes of data files to keep
+    '''
+    def __init__(self, directory, max_bytes):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.__n_bytes = None
+        self.__lock = threading.RLock()
+        self.__use_counts = {}
+        self.__orphans = set()
+
+    def __get_metadata_path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".metadata")
+
+    def get_metadata(self, key):
+        '''Get the metadata of an entry or None if it is not cached'''
+        try:
+            with open(self.__get_metadata_path(key), "r") as fd:
+                metadata = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+        if metadata.get("key") != key or \
+           not os.path.isfile(os.path.join(self.directory,
+                                           metadata["filename"])):
+            return None
+        return metadata
+
+    def get_path(self, key, acquire = False):
+        '''Get the path of an entry's data file or None if it is not cached
+
+        key - the entry's key
+
+        acquire - True to mark the data file in use, as :meth:`acquire`
+                  does, before it can be evicted
+        '''
+        with self.__lock:
+            metadata = self.get_metadata(key)
+            if metadata is None:
+                return None
+            path = os.path.join(self.directory, metadata["filename"])
+            try:
+                os.utime(path, None)
+            except OSError:
+                return None
+            if acquire:
+                self.acquire(path)
+            return path
+
+    def acquire(self, path):
+        '''Mark a data file in use, so that it isn't evicted or deleted
+
+        path - the path of the data file, as returned by :meth:`get_path`
+               or :meth:`put`
+
+        Call :meth:`release` when done with the file.
+        '''
+        with self.__lock:
+            self.__use_counts[path] = self.__use_counts.get(path, 0) + 1
+
+    def release(self, path):
+        '''Stop using a data file marked in use by :meth:`acquire`
+
+        The file is deleted if its entry was removed or replaced while it
+        was in use and no one else is using it.
+        '''
+        with self.__lock:
+            use_count = self.__use_counts.pop(path) - 1
+            if use_count > 0:
+                self.__use_counts[path] = use_count
+                return
+            if path in self.__orphans:
+                self.__orphans.discard(path)
+                self.__remove_data_file(path)
+
+    def __remove_data_file(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self.__n_bytes is not None:
+            self.__n_bytes = max(self.__n_bytes - size, 0)
+
+    def put(self, key, src, metadata = None, name = None, acquire = False):
+        '''Store an entry, replacing any old one
+
+        key - the entry's key
+
+        src - a file-like object or bytes to store
+
+        metadata - a dictionary of JSON-compatible metadata about the entry
+
+        name - a file name to end the data file's name with, for instance
+               to keep its extension. By default, the data file ends in
+               ".data".
+
+        acquire - True to mark the data file in use, as :meth:`acquire`
+                  does, before it can be evicted
+
+        Returns the path of the data file.
+        '''
+        metadata_path = self.__get_metadata_path(key)
+        filename = os.path.splitext(os.path.basename(metadata_path))[0] + \
+            ("-" + name if name else ".data")
+        metadata = dict(metadata or {})
+        metadata.update(key = key, filename = filename)
+        #
+        # Write temporary files and rename them, so that other readers of
+        # the cache never see part of an entry. Only the renames and the
+        # bookkeeping are done under the lock.
+        #
+        path = os.path.join(self.directory, filename)
+        tmp_paths = []
+        try:
+            data_fd, data_tmp_path = tempfile.mkstemp(dir=self.directory)
+            tmp_paths.append(data_tmp_path)
+            with os.fdopen(data_fd, "wb") as fd:
+                if isinstance(src, bytes):
+                    fd.write(src)
+                else:
+                    shutil.copyfileobj(src, fd)
+            metadata_fd, metadata_tmp_path = tempfile.mkstemp(
+                dir=self.directory)
+            tmp_paths.append(metadata_tmp_path)
+            with os.fdopen(metadata_fd, "w") as fd:
+                json.dump(metadata, fd)
+            with self.__lock:
+                self.remove(key)
+                #
+                # A data file that is in use stays in place when its entry
+                # is removed; the new one replaces it.
+                #
+                try:
+                    old_size = os.path.getsize(path)
+                except OSError:
+                    old_size = 0
+                os.rename(data_tmp_path, path)
+                self.__orphans.discard(path)
+                tmp_paths[0] = path
+                os.rename(metadata_tmp_path, metadata_path)
+                tmp_paths = []
+                if self.__n_bytes is not None:
+                    self.__n_bytes += os.path.getsize(path) - old_size
+                if acquire:
+                    self.acquire(path)
+                if self.__n_bytes is None or self.__n_bytes > self.max_bytes:
+                    self.evict(keep = path)
+        finally:
+            #
+            # Remove the temporary files, and the data file if its
+            # metadata file could not be put in place.
+            #
+            for tmp_path in tmp_paths:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return path
+
+    def remove(self, key):
+        '''Remove an entry from the cache
+
+        A data file that is in use is deleted when it is released.
+        '''
+        with self.__lock:
+            metadata = self.get_metadata(key)
+            try:
+                os.remove(self.__get_metadata_path(key))
+            except OSError:
+                pass
+            if metadata is None:
+                return
+            path = os.path.join(self.directory, metadata["filename"])
+            if path in self.__use_counts:
+                self.__orphans.add(path)
+            else:
+                self.__remove_data_file(path)
+
+    def evict(self, keep = None):
+        '''Remove the least recently used entries to fit within max_bytes
+
+        keep - the path of a data file not to remove. Data files that are
+               in use are not removed either.
+        '''
+        with self.__lock:
+            entries = []
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(".metadata"):
+                    continue
+                metadata_path = os.path.join(self.directory, filename)
+                try:
+                    with open(metadata_path, "r") as fd:
+                        path = os.path.join(self.directory,
+                                            json.load(fd)["filename"])
+                    stat = os.stat(path)
+                except (IOError, OSError, ValueError, KeyError):
+                    continue
+                entries.append(
+                    (stat.st_mtime, stat.st_size, path, metadata_path))
+            entries.sort()
+            n_bytes = sum([entry[1] for entry in entries])
+            #
+            # Count the data files of removed entries that are still in use
+            #
+            for path in self.__orphans:
+                try:
+                    n_bytes += os.path.getsize(path)
+                except OSError:
+                    pass
+            for mtime, size, path, metadata_path in entries:
+                if n_bytes <= self.max_bytes:
+                    break
+                if path == keep or path in self.__use_counts:
+                    continue
+                try:
+                    os.remove(metadata_path)
+                    os.remove(path)
+                except OSError:
+                    # The file may be open on Windows or already gone
+                    continue
+                n_bytes -= size
+            self.__n_bytes = n_bytes
+
+    def clear(self):
+        '''Remove all entries that are not in use'''
+        with self.__lock:
+            max_bytes, self.max_bytes = self.max_bytes, 0
+            try:
+                self.evict()
+            finally:
+                self.max_bytes = max_bytes
+
+__download_cache = None
+
+def enable_download_cache(directory, max_bytes):
+    '''Keep the files that image readers download from URLs
+
+    directory - the directory to keep downloaded files in
+
+    max_bytes - the most bytes of files to keep. The least recently used
+                files are removed to stay within it.
+
+    Cached files are revalidated with a conditional request, using their
+    ETag or Last-Modified header, each time their URL is read.
+    '''
+    global __download_cache
+    __download_cache = DiskCache(directory, max_bytes)
+    return __download_cache
+
+def disable_download_cache():
+    '''Download URLs to temporary files again'''
+    global __download_cache
+    __download_cache = None
+
+def get_download_cache():
+    '''Get the download cache's DiskCache or None if it is not enabled'''
+    return __download_cache
+
+def download_to_cache(url, cache):
+    '''Download a URL into a DiskCache, unless the cached copy is current
+
+    url - the URL to download
+
+    cache - the DiskCache to keep the file in
+
+    Returns the path of the cached file. The file is marked in use, so
+    that it isn't evicted; call the cache's :meth:`DiskCache.release` with
+    the path when done with it.
+    '''
+    metadata = cache.get_metadata(url)
+    headers = {}
+    if metadata is not None:
+        if metadata.get("etag") is not None:
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified") is not None:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+    try:
+        response = urlopen(Request(url, headers = headers))
+    except HTTPError as e:
+        if e.code == 304 and metadata is not None:
+            path = cache.get_path(url, acquire = True)
+            if path is not None:
+                return path
+        raise
+    try:
+        info = response.info()
+        filename = unquote(urlparse(url)[2].split("/")[-1])
+        return cache.put(url, response,
+                         dict(etag = info.get("ETag"),
+                              last_modified = info.get("Last-Modified")),
+                         name = filename, acquire = True)
+    finally:
+        response.close()
+
+'''The default size of the blocks that are fetched from streamed URLs'''
+DEFAULT_URL_BLOCK_SIZE = 256 * 1024
+'''The default # of blocks of a streamed URL to keep in memory'''
+DEFAULT_URL_MAX_BLOCKS = 64
+
+class URLRangeReader(object):
+    '''Read the file at an HTTP URL in blocks fetched with range requests
+
+    url - the URL of the file. The server must honor range requests.
+
+    block_size - the size of the blocks that are fetched. Runs of adjacent
+                 blocks that aren't cached are fetched in one request.
+
+    max_blocks - the # of blocks to cache. The least recently used blocks
+                 are dropped from the cache.
+    '''
+    def __init__(self, url, block_size = DEFAULT_URL_BLOCK_SIZE,
+                 max_blocks = DEFAULT_URL_MAX_BLOCKS):
+        self.url = url
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.n_requests = 0
+        self.n_bytes_fetched = 0
+        self.__blocks = collections.OrderedDict()
+        self.__lock = threading.RLock()
+        #
+        # The first block is fetched with the file's size
+        #
+        data, content_range = self.__fetch(0, block_size)
+        try:
+            self.size = int(content_range.rsplit("/", 1)[1])
+        except (AttributeError, IndexError, ValueError):
+            raise IOError(errno.EINVAL,
+                          "The server did not report the size of %s" % url)
+        self.__store(0, data)
+
+    def __fetch(self, start, stop):
+        '''Fetch the bytes from start up to stop
+
+        Returns the bytes and the Content-Range header of the response
+        '''
+        request = Request(self.url,
+                          headers = {"Range": "bytes=%d-%d" % (start, stop - 1)})
+        response = urlopen(request)
+        try:
+            if response.getcode() != 206:
+                raise IOError(
+                    errno.EINVAL,
+                    "The server does not support range requests for %s" %
+                    self.url)
+            data = response.read()
+            content_range = response.info().get("Content-Range")
+        finally:
+            response.close()
+        self.n_requests += 1
+        self.n_bytes_fetched += len(data)
+        return data, content_range
+
+    def __store(self, index, block):
+        self.__blocks[index] = block
+        while len(self.__blocks) > self.max_blocks:
+            self.__blocks.popitem(last=False)
+
+    def read(self, offset, n_bytes):
+        '''Read up to n_bytes bytes starting at offset
+
+        Returns fewer bytes if the read goes past the end of the file.
+        '''
+        bs = self.block_size
+        start = max(offset, 0)
+        stop = min(offset + n_bytes, self.size)
+        if stop <= start:
+            return b""
+        first, last = start // bs, (stop - 1) // bs
+        parts = []
+        with self.__lock:
+            index = first
+            while index <= last:
+                block = self.__blocks.pop(index, None)
+                if block is not None:
+                    self.__blocks[index] = block
+                    parts.append(block)
+                    index += 1
+                    continue
+                run_end = index
+                while run_end < last and run_end + 1 not in self.__blocks:
+                    run_end += 1
+                data, content_range = self.__fetch(
+                    index * bs, min((run_end + 1) * bs, self.size))
+                for i in range(index, run_end + 1):
+                    block = data[(i - index) * bs:(i - index + 1) * bs]
+                    self.__store(i, block)
+                    parts.append(block)
+                index = run_end + 1
+        data = b"".join(parts)
+        return data[start - first * bs:stop - first * bs]
+
+class URLRandomAccess(javabridge.JProxy):
+    '''A loci.common.IRandomAccess that reads a URLRangeReader
+
+    Bio-Formats readers read mapped files through it (see
+    :func:`map_file`), so only the parts of the file that are read are
+    fetched. It is read-only.
+    '''
+    def __init__(self, range_reader):
+        javabridge.JProxy.__init__(self, "loci.common.IRandomAccess")
+        self.range_reader = range_reader
+        self.position = 0
+        self.little_endian = False
+
+    def __read_bytes(self, n_bytes):
+        data = self.range_reader.read(self.position, n_bytes)
+        self.position += len(data)
+        return data
+
+    def __read_fully(self, n_bytes):
+        data = self.__read_bytes(n_bytes)
+        if len(data) < n_bytes:
+            raise EOFError("Read past the end of %s" % self.range_reader.url)
+        return data
+
+    def __unpack(self, fmt):
+        fmt = ("<" if self.little_endian else ">") + fmt
+        return struct.unpack(fmt, self.__read_fully(struct.calcsize(fmt)))[0]
+
+    def __read_into_array(self, jarray, offset, n_bytes):
+        data = self.__read_bytes(n_bytes)
+        if len(data) > 0:
+            src = jutil.get_env().make_byte_array(
+                np.frombuffer(bytearray(data), np.uint8))
+            jutil.static_call(
+                "java/lang/System", "arraycopy",
+                "(Ljava/lang/Object;ILjava/lang/Object;II)V",
+                src, 0, jarray, offset, len(data))
+        return len(data)
+
+    def __read_into_buffer(self, jbuffer, offset, n_bytes):
+        if offset is not None:
+            jutil.call(jbuffer, "position", "(I)Ljava/nio/Buffer;", offset)
+        data = self.__read_bytes(n_bytes)
+        if len(data) > 0:
+            src = jutil.get_env().make_byte_array(
+                np.frombuffer(bytearray(data), np.uint8))
+            jutil.call(jbuffer, "put", "([BII)Ljava/nio/ByteBuffer;",
+                       src, 0, len(data))
+        return len(data)
+
+    @staticmethod
+    def __unbox(o):
+        return jutil.call(o, "longValue", "()J")
+
+    def read(self, *args):
+        if jutil.is_instance_of(args[0], "java/nio/ByteBuffer"):
+            if len(args) == 1:
+                offset = None
+                n_bytes = jutil.call(args[0], "remaining", "()I")
+            else:
+                offset = self.__unbox(args[1])
+                n_bytes = self.__unbox(args[2])
+            n_read = self.__read_into_buffer(args[0], offset, n_bytes)
+        elif len(args) == 1:
+            n_bytes = jutil.get_env().get_array_length(args[0])
+            n_read = self.__read_into_array(args[0], 0, n_bytes)
+        else:
+            n_read = self.__read_into_array(
+                args[0], self.__unbox(args[1]), self.__unbox(args[2]))
+        if n_read == 0 and self.position >= self.range_reader.size:
+            return -1
+        return n_read
+
+    def readFully(self, *args):
+        if len(args) == 1:
+            offset, n_bytes = 0, jutil.get_env().get_array_length(args[0])
+        else:
+            offset, n_bytes = self.__unbox(args[1]), self.__unbox(args[2])
+        if self.position + n_bytes > self.range_reader.size:
+            raise EOFError("Read past the end of %s" % self.range_reader.url)
+        self.__read_into_array(args[0], offset, n_bytes)
+
+    def readBoolean(self):
+        return self.__unpack("b") != 0
+
+    def readByte(self):
+        return self.__unpack("b")
+
+    def readUnsignedByte(self):
+        return self.__unpack("B")
+
+    def readShort(self):
+        return self.__unpack("h")
+
+    def readUnsignedShort(self):
+        return self.__unpack("H")
+
+    def readChar(self):
+        return "%c" % self.__unpack("H")
+
+    def readInt(self):
+        return self.__unpack("i")
+
+    def readLong(self):
+        return self.__unpack("q")
+
+    def readFloat(self):
+        return self.__unpack("f")
+
+    def readDouble(self):
+        return self.__unpack("d")
+
+    def readLine(self):
+        if self.position >= self.range_reader.size:
+            return None
+        line = b""
+        while self.position < self.range_reader.size:
+            c = self.__read_bytes(1)
+            if c == b"\n":
+                break
+            line += c
+        return line.rstrip(b"\r").decode("latin-1")
+
+    def readUTF(self):
+        n_bytes = struct.unpack(">H", self.__read_fully(2))[0]
+        return self.__read_fully(n_bytes).decode("utf-8")
+
+    def skipBytes(self, n_bytes):
+        n_skipped = max(0, min(self.__unbox(n_bytes),
+                               self.range_reader.size - self.position))
+        self.position += n_skipped
+        return n_skipped
+
+    def seek(self, position):
+        self.position = self.__unbox(position)
+
+    def getFilePointer(self):
+        return self.position
+
+    def length(self):
+        return self.range_reader.size
+
+    def exists(self):
+        return True
+
+    def getOrder(self):
+        return jutil.get_static_field(
+            "java/nio/ByteOrder",
+            "LITTLE_ENDIAN" if self.little_endian else "BIG_ENDIAN",
+            "Ljava/nio/ByteOrder;")
+
+    def setOrder(self, order):
+        self.little_endian = \
+            jutil.call(order, "toString", "()Ljava/lang/String;") == \
+            "LITTLE_ENDIAN"
+
+    def close(self):
+        # Readers close and reopen their files, so stay readable
+        pass
+
+    def __write(self, *args):
+        raise IOError(errno.EACCES,
+                      "%s is read-only" % self.range_reader.url)
+
+    write = writeBoolean = writeByte = writeBytes = writeChar = \
+        writeChars = writeDouble = writeFloat = writeInt = writeLong = \
+        writeShort = writeUTF = setLength = __write
+
+    def hashCode(self):
+        return id(self) & 0x7fffffff
+
+    def equals(self, other):
+        return other is not None and \
+               jutil.call(other, "hashCode", "()I") == self.hashCode()
+
+    def toString(self):
+        return self.range_reader.url
+
+def make_byte_array_handle(data):
+    '''Make a loci.common.ByteArrayHandle of a copy of a bytes-like object'''
+    array = np.frombuffer(data, np.uint8)
+    if not array.flags.writeable:
+        array = array.copy()
+    jdata = jutil.get_env().make_byte_array(array)
+    return jutil.make_instance("loci/common/ByteArrayHandle", "([B)V", jdata)
+
+def map_file(file_id, handle):
+    '''Have Bio-Formats read a file id through an IRandomAccess handle
+
+    file_id - the name that Bio-Formats knows the file by
+
+    handle - a Java loci.common.IRandomAccess or None to unmap the file id
+    '''
+    jutil.static_call("loci/common/Location", "mapFile",
+                      "(Ljava/lang/String;Lloci/common/IRandomAccess;)V",
+                      file_id, handle)
+
+'''The default for the least # of milliseconds that initializing a reader
+must take before its state is memoized'''
+DEFAULT_MEMOIZER_MINIMUM_ELAPSED = 100
+
+__memoizer_options = None
+
+def enable_memoizer(directory = None,
+                    minimum_elapsed = DEFAULT_MEMOIZER_MINIMUM_ELAPSED):
+    '''Save the state of initialized readers on disk to reopen files quickly
+
+    Some formats take seconds or minutes to parse when an image reader is
+    initialized. Once memoization is enabled, image readers are wrapped in
+    a loci.formats.Memoizer, which saves the state of the initialized
+    reader in a memo file and loads it the next time the file is opened,
+    unless the file has been modified since.
+
+    directory - the directory to keep the memo files in. If None, each memo
+                file is kept in a hidden file next to its image file.
+
+    minimum_elapsed - only save the state of readers that took at least
+                      this many milliseconds to initialize.
+
+    Image readers can override this with the `memoize` argument of
+    :class:`ImageReader`.
+    '''
+    global __memoizer_options
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    __memoizer_options = (directory, minimum_elapsed)
+
+def disable_memoizer():
+    '''Stop saving the state of readers made from now on'''
+    global __memoizer_options
+    __memoizer_options = None
+
+def get_memoizer_options():
+    '''Get the memo directory and minimum elapsed time for memoization
+
+    Returns None if memoization is not enabled.
+    '''
+    return __memoizer_options
+
+def make_memoizer(jrdr, directory = None,
+                  minimum_elapsed = DEFAULT_MEMOIZER_MINIMUM_ELAPSED):
+    '''Wrap a Java reader in a loci.formats.Memoizer
+
+    jrdr - the Java reader to wrap
+
+    directory - the directory for memo files or None to keep them next to
+                the image files
+
+    minimum_elapsed - the least # of milliseconds that initializing
+                      the reader must take for its state to be saved.
+    '''
+    if directory is None:
+        return jutil.make_instance(
+            "loci/formats/Memoizer", "(Lloci/formats/IFormatReader;J)V",
+            jrdr, minimum_elapsed)
+    jdirectory = jutil.make_instance(
+        "java/io/File", "(Ljava/lang/String;)V", directory)
+    return jutil.make_instance(
+        "loci/formats/Memoizer",
+        "(Lloci/formats/IFormatReader;JLjava/io/File;)V",
+        jrdr, minimum_elapsed, jdirectory)
+
+class PlaneCache(object):
+    '''A least-recently-used cache of decoded planes, bounded by total bytes
+
+    Planes are keyed by the path, modification time, series, resolution,
+    plane index and XYWH region they were read from. Pass a cache to
+    :class:`ImageReader` to give it a cache of its own or use
+    :func:`set_plane_cache` to share one cache among all image readers.
+
+    max_bytes - the total size of the planes the cache may hold. The least
+                recently used planes are evicted to stay under it.
+    '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__planes = collections.OrderedDict()
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__planes)
+
+    def get(self, key):
+        '''Get the plane stored under a key or None if it is not cached'''
+        with self.__lock:
+            data = self.__planes.pop(key, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.__planes[key] = data
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        '''Store a plane's bytes, evicting planes to make room
+
+        Planes that are larger than the cache are not stored.
+        '''
+        with self.__lock:
+            old_data = self.__planes.pop(key, None)
+            if old_data is not None:
+                self.n_bytes -= old_data.nbytes
+            if data.nbytes > self.max_bytes:
+                return
+            while self.n_bytes + data.nbytes > self.max_bytes:
+                evicted_key, evicted_data = self.__planes.popitem(last=False)
+                self.n_bytes -= evicted_data.nbytes
+                self.evictions += 1
+            self.__planes[key] = data
+            self.n_bytes += data.nbytes
+
+    def invalidate(self, path = None, mtime = None):
+        '''Remove the planes of one file or all planes if path is None
+
+        path - the path of the file whose planes should be removed
+
+        mtime - if not None, only remove the file's planes that were read
+                when its modification time was different.
+        '''
+        with self.__lock:
+            if path is None:
+                self.__planes.clear()
+                self.n_bytes = 0
+                return
+            for key in [key for key in self.__planes
+                        if key[0] == path and
+                        (mtime is None or key[1] != mtime)]:
+                self.n_bytes -= self.__planes.pop(key).nbytes
+
+    def get_stats(self):
+        '''Get the cache's statistics
+
+        Returns a dictionary of the number of hits, misses and evictions,
+        the hit rate, the number of planes cached (size) and their total
+        size in bytes.
+        '''
+        with self.__lock:
+            n_lookups = self.hits + self.misses
+            return dict(hits = self.hits,
+                        misses = self.misses,
+                        evictions = self.evictions,
+                        hit_rate = float(self.hits) / n_lookups
+                                   if n_lookups > 0 else 0.0,
+                        size = len(self.__planes),
+                        n_bytes = self.n_bytes,
+                        max_bytes = self.max_bytes)
+
+__plane_cache = None
+
+def set_plane_cache(max_bytes):
+    '''Share a cache of decoded planes among all image readers
+
+    max_bytes - the total size of the planes to cache or None to stop
+                caching. Image readers that were given their own cache
+                keep using it.
+
+    Returns the new cache.
+    '''
+    global __plane_cache
+    if __plane_cache is not None:
+        __plane_cache.invalidate()
+    __plane_cache = None if max_bytes is None else PlaneCache(max_bytes)
+    return __plane_cache
+
+def get_plane_cache():
+    '''Get the plane cache shared by image readers or None if there is none'''
+    return __plane_cache
+
+'''The default # of planes that an ImageReader decodes ahead of reads'''
+DEFAULT_PREFETCH_DEPTH = 4
+
+class PlanePrefetcher(object):
+    '''Decode the planes that will be read next on a background thread
+
+    The prefetcher keeps a window of the keys of the planes expected to be
+    read next and a thread, attached to the Java VM, decodes them in order
+    into a buffer that holds at most `depth` planes. Each call to
+    :meth:`get` takes its plane from the buffer, if it is there, and moves
+    the window on.
+
+    decode - a function that decodes the plane for a key. It is called on
+             the prefetcher's thread.
+
+    depth - the # of planes to decode ahead
+
+    plan - the keys of the planes in the order they will be read or None
+           to pass the keys to expect with each call to :meth:`get`
+    '''
+    def __init__(self, decode, depth=DEFAULT_PREFETCH_DEPTH, plan=None):
+        if depth < 1:
+            raise ValueError("The prefetch depth must be at least 1")
+        self.decode = decode
+        self.depth = depth
+        self.plan = None if plan is None else list(plan)
+        self.last_key = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.wasted = 0
+        self.__position = 0
+        self.__window = [] if plan is None else self.plan[:depth]
+        self.__planes = {}
+        self.__decoding = None
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="PlanePrefetcher")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __run(self):
+        jutil.attach()
+        try:
+            while True:
+                with self.__condition:
+                    key = None
+                    while not self.__closed:
+                        for key in self.__window:
+                            if key not in self.__planes:
+                                break
+                        else:
+                            key = None
+                        if key is not None:
+                            break
+                        self.__condition.wait()
+                    if self.__closed:
+                        break
+                    self.__decoding = key
+                try:
+                    image = self.decode(key)
+                except:
+                    logger.debug("Failed to prefetch plane", exc_info=True)
+                    image = None
+                with self.__condition:
+                    self.__decoding = None
+                    if image is None:
+                        # Leave the plane to be read, and fail, when asked for
+                        self.__window = [k for k in self.__window if k != key]
+                    elif key in self.__window and not self.__closed:
+                        self.__planes[key] = image
+                        self.prefetched += 1
+                    else:
+                        self.wasted += 1
+                    self.__condition.notify_all()
+        finally:
+            jutil.detach()
+
+    def get(self, key, successors=None):
+        '''Take the plane for a key from the buffer
+
+        key - the key of the plane being read
+
+        successors - the keys of the planes expected to be read after this
+                     one, in order. Ignored if the prefetcher has a plan.
+
+        Returns the plane or None if it has not been decoded. The planes
+        expected next are decoded in the background.
+        '''
+        with self.__condition:
+            while self.__decoding == key:
+                self.__condition.wait()
+            image = self.__planes.pop(key, None)
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if self.plan is not None:
+                try:
+                    self.__position = self.plan.index(key, self.__position) + 1
+                except ValueError:
+                    pass
+                window = self.plan[self.__position:
+                                   self.__position + self.depth]
+            else:
+                window = [] if successors is None \
+                    else list(successors)[:self.depth]
+            self.last_key = key
+            self.__window = window
+            for stale_key in [k for k in self.__planes if k not in window]:
+                del self.__planes[stale_key]
+                self.wasted += 1
+            self.__condition.notify_all()
+            return image
+
+    def close(self):
+        '''Stop the prefetcher's thread and drop the buffered planes'''
+        with self.__condition:
+            self.__closed = True
+            self.__planes.clear()
+            self.__window = []
+            self.__condition.notify_all()
+        if self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+    def get_stats(self):
+        '''Get the prefetcher's statistics
+
+        Returns a dictionary of the prefetch depth, the number of reads
+        served from the buffer (hits) and not (misses), the hit rate, the
+        number of planes decoded ahead (prefetched), the number dropped
+        without being read (wasted), the number buffered now (size) and the
+        number still to decode in the window (pending).
+        '''
+        with self.__condition:
+            n_lookups = self.hits + self.misses
+            return dict(depth = self.depth,
+                        hits = self.hits,
+                        misses = self.misses,
+                        hit_rate = float(self.hits) / n_lookups
+                                   if n_lookups > 0 else 0.0,
+                        prefetched = self.prefetched,
+                        wasted = self.wasted,
+                        size = len(self.__planes),
+                        pending = len([k for k in self.__window
+                                       if k not in self.__planes]))
+
+'''The geometry of a series at one resolution level
+
+series, resolution - the series and resolution level that this describes
+
+pixel_type - the Bio-Formats pixel type (see FormatTools)
+
+dtype - the Numpy dtype of the raw plane data
+
+scale - the value that `ImageReader.read` divides by when rescaling
+
+size_x, size_y, size_z, size_c, size_t - the dimensions of the series
+
+rgb_channel_count - the # of channels stored in each plane
+
+is_rgb, is_interleaved, is_indexed - the layout of the planes
+'''
+ReaderGeometry = collections.namedtuple(
+    "ReaderGeometry",
+    ["series", "resolution", "pixel_type", "dtype", "scale",
+     "size_x", "size_y", "size_z", "size_c", "size_t",
+     "rgb_channel_count", "is_rgb", "is_interleaved", "is_indexed"])
+
+'''The # of plane buffers of different sizes that an ImageReader keeps'''
+MAX_JAVA_BUFFERS = 4
+
 class ImageReader(object):
     '''Find the appropriate reader for a file.
 
@@ -545,10 +1895,67 @@ class ImageReader(object):
     It uses `__enter__` and `__exit__` to manage the random access stream
     that can be used to cache the file contents in memory.
 
+    Pass ``flatten_resolutions=False`` to see the resolution levels of
+    whole-slide images as levels of one series, which can be picked with
+    the `resolution` argument of :meth:`read`, rather than as separate
+    series.
+
+    Pass a :class:`PlaneCache` as `plane_cache` to keep the planes this
+    reader decodes in a cache of its own. Otherwise, the reader uses the
+    cache set by :func:`set_plane_cache`, if any.
+
+    Pass ``memoize=True`` or ``memoize=False`` to save the initialized
+    reader's state on disk or not, regardless of :func:`enable_memoizer`.
+
+    Pass the contents of an image file as `data`, a bytes-like object, to
+    read it from memory. `path` is then optional and only used as a file
+    name, whose extension can help Bio-Formats recognize the format.
+
+    Pass `metadata_level`, one of ``metadatatools.MINIMUM``,
+    ``metadatatools.NO_OVERLAYS`` or ``metadatatools.ALL``, to choose how
+    much of the file's metadata Bio-Formats parses, and pass
+    ``omexml_metadata=False`` to skip building an OME-XML metadata store.
+    A reader that only reads pixels opens faster with
+    ``metadata_level=metadatatools.MINIMUM, omexml_metadata=False``.
+    Pass ``original_metadata=True`` to keep the file's original metadata
+    as annotations of the OME-XML metadata (see :meth:`get_omexml`).
+
+    Pass ``stream_url=True`` to read an http or https URL with range
+    requests, fetching only the parts of the file that are read, rather
+    than downloading the whole file first. URLs whose server doesn't
+    support range requests are downloaded.
+
     '''
 
-    def __init__(self, path=None, url=None, perform_init=True):
+    def __init__(self, path=None, url=None, perform_init=True,
+                 flatten_resolutions=True, plane_cache=None, memoize=None,
+                 stream_url=False, data=None,
+                 metadata_level=metadatatools.ALL, omexml_metadata=True,
+                 original_metadata=False):
+        if metadata_level not in (metadatatools.MINIMUM,
+                                  metadatatools.NO_OVERLAYS,
+                                  metadatatools.ALL):
+            raise ValueError("Unknown metadata level: %s" % metadata_level)
+        self.metadata_level = metadata_level
+        self.omexml_metadata = omexml_metadata
+        self.original_metadata = original_metadata
+        self.metadata = None
         self.stream = None
+        self.url_handle = None
+        self.data_handle = None
+        self.mapped_id = None
+        self.download_cache = None
+        self.flatten_resolutions = flatten_resolutions
+        if memoize is None:
+            memoize = get_memoizer_options() is not None
+        self.memoize = memoize
+        self.plane_cache = plane_cache
+        self.__plane_mtime = None
+        self.__java_buffers = {}
+        self.__geometry = {}
+        self.__channel_separator = None
+        self.__lock = threading.RLock()
+        self.__prefetcher = None
         file_scheme = "file:"
         self.using_temp_file = False
 
@@ -559,7 +1966,16 @@ class ImageReader(object):
                 path = url
 
         self.path = path
-        if path is None:
+        if data is not None:
+            #
+            # Map the bytes to a file id that Bio-Formats reads from memory
+            #
+            filename = os.path.split(path)[1] if path is not None else "image"
+            self.path = "%s-%s" % (uuid.uuid4().hex, filename)
+            self.data_handle = make_byte_array_handle(data)
+            map_file(self.path, self.data_handle)
+            self.mapped_id = self.path
+        elif path is None:
             if url.lower().startswith("omero:"):
                 while True:
                     #
@@ -596,30 +2012,52 @@ class ImageReader(object):
                                 errno.EINVAL, "Could not load the file as an image (see log for details)", path.encode('utf-8'))
                             raise e2
             else:
-                #
-                # Other URLS, copy them to a tempfile location
-                #
-                ext = url[url.rfind("."):]
-                src = urlopen(url)
-                dest_fd, self.path = tempfile.mkstemp(suffix=ext)
-                try:
-                    dest = os.fdopen(dest_fd, 'wb')
-                    shutil.copyfileobj(src, dest)
-                except:
-                    src.close()
-                    dest.close()
-                    os.remove(self.path)
-                self.using_temp_file = True
-                src.close()
-                dest.close()
+                if stream_url and url.lower().startswith(("http:", "https:")):
+                    try:
+                        self.url_handle = URLRandomAccess(URLRangeReader(url))
+                    except IOError:
+                        logger.info("Can't stream %s, so downloading it" % url,
+                                    exc_info=True)
                 urlpath = urlparse(url)[2]
                 filename = unquote(urlpath.split("/")[-1])
+                if self.url_handle is not None:
+                    #
+                    # Bio-Formats reads the file through the handle, which
+                    # fetches only the parts that are read.
+                    #
+                    self.path = "%s-%s" % (uuid.uuid4().hex, filename)
+                    map_file(self.path, self.url_handle.o)
+                    self.mapped_id = self.path
+                elif get_download_cache() is not None:
+                    #
+                    # Keep the cache from evicting the file while it's open
+                    #
+                    cache = get_download_cache()
+                    self.path = download_to_cache(url, cache)
+                    self.download_cache = cache
+                else:
+                    #
+                    # Other URLS, copy them to a tempfile location
+                    #
+                    ext = url[url.rfind("."):]
+                    src = urlopen(url)
+                    dest_fd, self.path = tempfile.mkstemp(suffix=ext)
+                    try:
+                        dest = os.fdopen(dest_fd, 'wb')
+                        shutil.copyfileobj(src, dest)
+                    except:
+                        src.close()
+                        dest.close()
+                        os.remove(self.path)
+                    self.using_temp_file = True
+                    src.close()
+                    dest.close()
         else:
             if sys.platform.startswith("win"):
                 self.path = self.path.replace("/", os.path.sep)
             filename = os.path.split(path)[1]
 
-        if not os.path.isfile(self.path):
+        if self.mapped_id is None and not os.path.isfile(self.path):
             raise IOError(
                 errno.ENOENT,
                 "The file, \"%s\", does not exist." % path,
@@ -630,48 +2068,23 @@ class ImageReader(object):
                                           self.path)
 
         self.rdr = None
-        class_list = get_class_list()
-        find_rdr_script = """
-        var classes = class_list.getClasses();
-        var rdr = null;
-        var lc_filename = java.lang.String(filename.toLowerCase());
-        for (pass=0; pass < 3; pass++) {
-            for (class_idx in classes) {
-                var maybe_rdr = classes[class_idx].newInstance();
-                if (pass == 0) {
-                    if (maybe_rdr.isThisType(filename, false)) {
-                        rdr = maybe_rdr;
-                        break;
-                    }
-                    continue;
-                } else if (pass == 1) {
-                    var suffixes = maybe_rdr.getSuffixes();
-                    var suffix_found = false;
-                    for (suffix_idx in suffixes) {
-                        var suffix = java.lang.String(suffixes[suffix_idx]);
-                        suffix = suffix.toLowerCase();
-                        if (lc_filename.endsWith(suffix)) {
-                            suffix_found = true;
-                            break;
-                        }
-                    }
-                    if (! suffix_found) continue;
-                }
-                if (maybe_rdr.isThisType(stream)) {
-                    rdr = maybe_rdr;
-                    break;
-                }
-            }
-            if (rdr) break;
-        }
-        rdr;
-        """
         IFormatReader = make_iformat_reader_class()
-        jrdr = jutil.run_script(find_rdr_script, dict(class_list = class_list,
-                                                      filename = filename,
-                                                      stream = self.stream))
+        try:
+            jrdr = find_reader(filename, self.stream)
+        finally:
+            #
+            # The reader opens the file itself, so don't hold the stream
+            # open once it has been used to find the reader.
+            #
+            jutil.call(self.stream, 'close', '()V')
+            self.stream = None
         if jrdr is None:
             raise ValueError("Could not find a Bio-Formats reader for %s", self.path)
+        if self.memoize:
+            options = get_memoizer_options()
+            if options is None:
+                options = (None, DEFAULT_MEMOIZER_MINIMUM_ELAPSED)
+            jrdr = make_memoizer(jrdr, *options)
         self.rdr = IFormatReader()
         self.rdr.o = jrdr
         if perform_init:
@@ -684,6 +2097,7 @@ class ImageReader(object):
         self.close()
 
     def close(self):
+        self.disable_prefetch()
         if hasattr(self, "rdr"):
             self.rdr.close()
             del self.rdr.o
@@ -694,17 +2108,49 @@ class ImageReader(object):
         if self.using_temp_file:
             os.remove(self.path)
             self.using_temp_file = False
+        if self.mapped_id is not None:
+            map_file(self.mapped_id, None)
+            self.mapped_id = None
+            self.url_handle = None
+            self.data_handle = None
+        if self.download_cache is not None:
+            self.download_cache.release(self.path)
+            self.download_cache = None
+        self.__java_buffers.clear()
+        self.__geometry.clear()
+        self.__channel_separator = None
+        #
+        # The cache may be shared with readers of other files, so only
+        # remove this file's planes.
+        #
+        cache = self.__get_plane_cache()
+        if cache is not None:
+            cache.invalidate(self.path)
         #
         # Run the Java garbage collector here.
         #
         jutil.static_call("java/lang/System", "gc","()V")
 
     def init_reader(self):
-        mdoptions = metadatatools.get_metadata_options(metadatatools.ALL)
+        mdoptions = metadatatools.get_metadata_options(self.metadata_level)
         self.rdr.setMetadataOptions(mdoptions)
         self.rdr.setGroupFiles(False)
-        self.metadata = metadatatools.createOMEXMLMetadata()
-        self.rdr.setMetadataStore(self.metadata)
+        if not self.flatten_resolutions:
+            self.rdr.setFlattenedResolutions(False)
+        if self.original_metadata:
+            jutil.call(self.rdr.o, "setOriginalMetadataPopulated", "(Z)V",
+                       True)
+        if self.omexml_metadata:
+            self.metadata = metadatatools.createOMEXMLMetadata()
+            self.rdr.setMetadataStore(self.metadata)
+        else:
+            self.metadata = None
+        #
+        # The geometry and the channel separator's last plane are those of
+        # the file as it was at the last setId
+        #
+        self.__geometry.clear()
+        self.__channel_separator = None
         try:
             self.rdr.setId(self.path)
         except jutil.JavaException as e:
@@ -732,36 +2178,145 @@ class ImageReader(object):
             raise e2
 
 
-    def read(self, c = None, z = 0, t = 0, series = None, index = None,
-             rescale = True, wants_max_intensity = False, channel_names = None, XYWH=None):
-        '''Read a single plane from the image reader file.
-        :param c: read from this channel. `None` = read color image if multichannel
-            or interleaved RGB.
-        :param z: z-stack index
-        :param t: time index
-        :param series: series for ``.flex`` and similar multi-stack formats
-        :param index: if `None`, fall back to ``zct``, otherwise load the indexed frame
-        :param rescale: `True` to rescale the intensity scale to 0 and 1; `False` to
-                  return the raw values native to the file.
-        :param wants_max_intensity: if `False`, only return the image; if `True`,
-                  return a tuple of image and max intensity
-        :param channel_names: provide the channel names for the OME metadata
-        :param XYWH: a (x, y, w, h) tuple
+    def close_file(self):
+        '''Close the reader's files, but keep its state
+
+        Call :meth:`reopen_file` before reading again.
         '''
-        if XYWH is not None:
-            assert isinstance(XYWH, tuple) and len(XYWH) == 4, "Invalid XYWH tuple"
-            openBytes_func = lambda x: self.rdr.openBytesXYWH(x, XYWH[0], XYWH[1], XYWH[2], XYWH[3])
-            width, height = XYWH[2], XYWH[3]
-        else:
-            openBytes_func = self.rdr.openBytes
-            width, height = self.rdr.getSizeX(), self.rdr.getSizeY()
-        FormatTools = make_format_tools_class()
-        ChannelSeparator = make_reader_wrapper_class(
-            "loci/formats/ChannelSeparator")
-        env = jutil.get_env()
-        if series is not None:
-            self.rdr.setSeries(series)
+        self.rdr.closeFile(True)
+
+    def reopen_file(self):
+        '''Reopen the files closed by :meth:`close_file`'''
+        self.rdr.reopenFile()
+
+    def is_loaded_from_memo(self):
+        '''Return True if the reader's state was loaded from a memo file'''
+        if not self.memoize:
+            return False
+        return jutil.call(self.rdr.o, "isLoadedFromMemo", "()Z")
+
+    def get_omexml(self):
+        '''Get the OME-XML metadata that the reader parsed when it opened the file
+
+        Returns a :class:`bioformats.omexml.OMEXML` made from the reader's
+        metadata store, without parsing the file again. Raises ValueError
+        if the reader has no store, because it was made with
+        ``perform_init=False`` or ``omexml_metadata=False``.
+        '''
+        if self.metadata is None:
+            raise ValueError("The reader has no OME-XML metadata store")
+        return OMEXML(metadatatools.getOMEXML(self.metadata))
+
+    def get_resolution_count(self, series = None):
+        '''Get the # of resolution levels of a series
 
+        :param series: the series to query or `None` for the current one.
+
+        Whole-slide formats store a pyramid of progressively smaller
+        copies of each plane. These are only reported as resolution levels
+        if the reader was created with ``flatten_resolutions=False``;
+        otherwise each level is a series of its own. The selected series
+        and resolution are left unchanged.
+        '''
+        with self.__lock:
+            if series is None:
+                return self.rdr.getResolutionCount()
+            #
+            # Leave the caller's series and resolution selected
+            #
+            current_series = self.rdr.getSeries()
+            current_resolution = self.rdr.getResolution()
+            try:
+                self.get_geometry(series)
+                return self.rdr.getResolutionCount()
+            finally:
+                self.get_geometry(current_series, current_resolution)
+
+    def get_resolution_dimensions(self, series = None):
+        '''Get the size of each resolution level of a series
+
+        :param series: the series to query or `None` for the current one.
+
+        :returns: a list of (width, height) tuples, one per resolution
+                  level, starting with full resolution.
+
+        The selected series and resolution are left unchanged.
+        '''
+        with self.__lock:
+            #
+            # Leave the caller's series and resolution selected
+            #
+            current_series = self.rdr.getSeries()
+            current_resolution = self.rdr.getResolution()
+            dimensions = []
+            try:
+                self.get_geometry(series)
+                for resolution in range(self.rdr.getResolutionCount()):
+                    geometry = self.get_geometry(resolution = resolution)
+                    dimensions.append((geometry.size_x, geometry.size_y))
+            finally:
+                self.get_geometry(current_series, current_resolution)
+            return dimensions
+
+    def get_geometry(self, series = None, resolution = None):
+        '''Get the geometry of a series at a resolution level
+
+        :param series: the series to select or `None` for the current one.
+        :param resolution: the resolution level to select or `None` for the
+                  current one.
+
+        Selects the series and resolution, unless they are already
+        selected, and returns a :class:`ReaderGeometry` of their pixel
+        type and dimensions. The geometry is looked up once per series and
+        resolution, until the reader is closed.
+        '''
+        with self.__lock:
+            current_series = self.rdr.getSeries()
+            if series is not None and series != current_series:
+                self.rdr.setSeries(series)
+                current_series = series
+            current_resolution = self.rdr.getResolution()
+            if resolution is not None and resolution != current_resolution:
+                self.rdr.setResolution(resolution)
+                current_resolution = resolution
+            key = (current_series, current_resolution)
+            geometry = self.__geometry.get(key)
+            if geometry is None:
+                pixel_type, dtype, scale = self.get_pixel_dtype_and_scale()
+                geometry = ReaderGeometry(
+                    series = current_series,
+                    resolution = current_resolution,
+                    pixel_type = pixel_type,
+                    dtype = np.dtype(dtype),
+                    scale = scale,
+                    size_x = self.rdr.getSizeX(),
+                    size_y = self.rdr.getSizeY(),
+                    size_z = self.rdr.getSizeZ(),
+                    size_c = self.rdr.getSizeC(),
+                    size_t = self.rdr.getSizeT(),
+                    rgb_channel_count = self.rdr.getRGBChannelCount(),
+                    is_rgb = self.rdr.isRGB(),
+                    is_interleaved = self.rdr.isInterleaved(),
+                    is_indexed = self.rdr.isIndexed())
+                self.__geometry[key] = geometry
+            return geometry
+
+    def get_channel_separator(self):
+        '''Get a ChannelSeparator that reads this reader's channels as planes'''
+        if self.__channel_separator is None:
+            ChannelSeparator = make_reader_wrapper_class(
+                "loci/formats/ChannelSeparator")
+            self.__channel_separator = ChannelSeparator(self.rdr)
+        return self.__channel_separator
+
+    def get_pixel_dtype_and_scale(self):
+        '''Get the pixel type, Numpy dtype and maximum intensity of the series
+
+        :returns: a tuple of the Bio-Formats pixel type (see FormatTools), the
+                  Numpy dtype of the raw plane data and the value that
+                  `read` divides by when rescaling.
+        '''
+        FormatTools = make_format_tools_class()
         pixel_type = self.rdr.getPixelType()
         little_endian = self.rdr.isLittleEndian()
         if pixel_type == FormatTools.INT8:
@@ -794,61 +2349,230 @@ class ImageReader(object):
                 scale = jutil.call(max_sample_value, 'intValue', '()I')
             except:
                 logger.warning("WARNING: failed to get MaxSampleValue for image. Intensities may be improperly scaled.")
+        return pixel_type, dtype, scale
+
+    def __get_plane_cache(self):
+        if self.plane_cache is not None:
+            return self.plane_cache
+        return get_plane_cache()
+
+    def __get_plane_key(self, rdr, index, XYWH):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except (OSError, IOError):
+            mtime = None
+        return (self.path, mtime, rdr is self.rdr, self.rdr.getSeries(),
+                self.rdr.getResolution(), index, XYWH,
+                self.flatten_resolutions)
+
+    def open_bytes(self, rdr, index, n_bytes, XYWH=None):
+        '''Read the raw bytes of a plane using this reader's plane buffers
+
+        rdr - the reader to use: this reader's IFormatReader or a wrapper
+              around it, such as a ChannelSeparator.
+
+        index - the index of the plane to read
+
+        n_bytes - the size of the plane (or its XYWH region) in bytes
+
+        XYWH - a (x, y, w, h) tuple to read only part of the plane
+
+        Each plane size gets one Java byte array, allocated on first use,
+        which Bio-Formats fills in place, so streaming reads don't allocate
+        a new Java array per plane.
+
+        Returns a Numpy uint8 array holding the only Python-side copy of the
+        pixel data. Callers view it with np.frombuffer and copy it at most
+        once more, into their output array. IFormatReader can only write
+        into a byte array and the JNI wrapper can't wrap Numpy memory in a
+        direct ByteBuffer, so this copy can't be avoided.
+
+        If the reader has a plane cache, planes are looked up in it first
+        and returned as copies of the cached bytes. A plane that is not
+        cached yet is stored read-only and returned without a copy.
+        '''
+        cache = self.__get_plane_cache()
+        if cache is None or self.path is None:
+            return self.__open_bytes(rdr, index, n_bytes, XYWH)
+        key = self.__get_plane_key(rdr, index, XYWH)
+        data = cache.get(key)
+        if data is None:
+            if key[1] != self.__plane_mtime:
+                #
+                # The file may have changed, so drop its stale planes
+                #
+                cache.invalidate(self.path, key[1])
+                self.__plane_mtime = key[1]
+            data = self.__open_bytes(rdr, index, n_bytes, XYWH)
+            data.flags.writeable = False
+            cache.put(key, data)
+            return data
+        return data.copy()
+
+    def __open_bytes(self, rdr, index, n_bytes, XYWH):
+        jbuffer = self.__java_buffers.get(n_bytes)
+        if jbuffer is None:
+            if len(self.__java_buffers) >= MAX_JAVA_BUFFERS:
+                self.__java_buffers.clear()
+            jbuffer = jutil.get_env().make_byte_array(
+                np.zeros(n_bytes, np.uint8))
+            self.__java_buffers[n_bytes] = jbuffer
+        if XYWH is None:
+            return rdr.openBytesBuffer(index, jbuffer)
+        return rdr.openBytesBufferXYWH(index, jbuffer, *XYWH)
+
+    def read(self, c = None, z = 0, t = 0, series = None, index = None,
+             rescale = True, wants_max_intensity = False, channel_names = None, XYWH=None,
+             out = None, resolution = None):
+        '''Read a single plane from the image reader file.
+        :param c: read from this channel. `None` = read color image if multichannel
+            or interleaved RGB.
+        :param z: z-stack index
+        :param t: time index
+        :param series: series for ``.flex`` and similar multi-stack formats
+        :param index: if `None`, fall back to ``zct``, otherwise load the indexed frame
+        :param rescale: `True` to rescale the intensity scale to 0 and 1; `False` to
+                  return the raw values native to the file.
+        :param wants_max_intensity: if `False`, only return the image; if `True`,
+                  return a tuple of image and max intensity
+        :param channel_names: provide the channel names for the OME metadata.
+                  The names are None if the reader has no OME-XML metadata
+                  store.
+        :param XYWH: a (x, y, w, h) tuple
+        :param out: an array to write the image into, for instance a view of
+                  a larger preallocated volume. Its shape must be the shape
+                  of the image that would be returned; it is returned in
+                  place of a new array. It must have a floating-point
+                  dtype if `rescale` is `True`; otherwise TypeError is
+                  raised.
+        :param resolution: the resolution level to read, 0 being full
+                  resolution. `None` leaves the level unchanged. See
+                  :meth:`get_resolution_dimensions`.
+
+        If prefetching is enabled (see :meth:`enable_prefetch`), the plane
+        is taken from the prefetch buffer when it has already been decoded.
+        '''
+        check_out_dtype(out, rescale)
+        prefetcher = self.__prefetcher
+        if prefetcher is None or channel_names is not None:
+            with self.__lock:
+                return self.__read(c, z, t, series, index, rescale,
+                                   wants_max_intensity, channel_names, XYWH,
+                                   out, resolution)
+        with self.__lock:
+            geometry = self.get_geometry(series, resolution)
+            key = self.__get_prefetch_key(
+                c, z, t, geometry.series, index, rescale, XYWH,
+                geometry.resolution)
+            successors = None if prefetcher.plan is not None else \
+                self.__get_prefetch_successors(key, prefetcher.last_key,
+                                               prefetcher.depth)
+        image = prefetcher.get(key, successors)
+        if image is None:
+            image = self.__read_prefetch_key(key)
+        if out is not None:
+            if tuple(out.shape) != tuple(image.shape):
+                raise ValueError(
+                    "The output array's shape is %s, but the image's is %s" %
+                    (repr(tuple(out.shape)), repr(tuple(image.shape))))
+            out[...] = image
+            image = out
+        if wants_max_intensity:
+            return image, geometry.scale
+        return image
+
+    def __read(self, c, z, t, series, index, rescale, wants_max_intensity,
+               channel_names, XYWH, out, resolution):
+        env = jutil.get_env()
+        geometry = self.get_geometry(series, resolution)
+        if XYWH is not None:
+            assert isinstance(XYWH, tuple) and len(XYWH) == 4, "Invalid XYWH tuple"
+            width, height = XYWH[2], XYWH[3]
+        else:
+            width, height = geometry.size_x, geometry.size_y
+
+        pixel_type, dtype, scale = \
+            geometry.pixel_type, geometry.dtype, geometry.scale
+        channel_bytes = width * height * dtype.itemsize
+        plane_bytes = channel_bytes * geometry.rgb_channel_count
+        openBytes_func = lambda x: self.open_bytes(self.rdr, x, plane_bytes, XYWH)
+        def check_shape(dest_shape, src_shape):
+            if tuple(dest_shape) != tuple(src_shape):
+                raise ValueError(
+                    "The output array's shape is %s, but the image's is %s" %
+                    (repr(tuple(dest_shape)), repr(tuple(src_shape))))
+        def store(dest, src):
+            # Copy raw pixels into the output, rescaling on the way
+            check_shape(dest.shape, src.shape)
+            if rescale:
+                np.divide(src, float(scale), out=dest, dtype=np.float32)
+            else:
+                dest[...] = src
+        def make_color_image(n_channels):
+            if out is not None:
+                check_shape(out.shape, (height, width, n_channels))
+                return out
+            return np.empty((height, width, n_channels),
+                            np.float32 if rescale else dtype)
+        is_stored = False
         if index is not None:
             image = np.frombuffer(openBytes_func(index), dtype)
             if len(image) / height / width in (3,4):
                 n_channels = int(len(image) / height / width)
-                if self.rdr.isInterleaved():
+                if geometry.is_interleaved:
                     image.shape = (height, width, n_channels)
                 else:
                     image.shape = (n_channels, height, width)
                     image = image.transpose(1, 2, 0)
             else:
                 image.shape = (height, width)
-        elif self.rdr.isRGB() and self.rdr.isInterleaved():
+        elif geometry.is_rgb and geometry.is_interleaved:
             index = self.rdr.getIndex(z,0,t)
             image = np.frombuffer(openBytes_func(index), dtype)
-            image.shape = (height, width, self.rdr.getSizeC())
+            image.shape = (height, width, geometry.size_c)
             if image.shape[2] > 3:
                 image = image[:, :, :3]
-        elif c is not None and self.rdr.getRGBChannelCount() == 1:
+        elif c is not None and geometry.rgb_channel_count == 1:
             index = self.rdr.getIndex(z,c,t)
             image = np.frombuffer(openBytes_func(index), dtype)
             image.shape = (height, width)
-        elif self.rdr.getRGBChannelCount() > 1:
-            n_planes = self.rdr.getRGBChannelCount()
-            rdr = ChannelSeparator(self.rdr)
-            planes = [
-                np.frombuffer(
-                    (rdr.openBytes(rdr.getIndex(z,i,t)) if XYWH is None else
-                      rdr.openBytesXYWH(rdr.getIndex(z,i,t), XYWH[0], XYWH[1], XYWH[2], XYWH[3])),
-                      dtype
-                ) for i in range(n_planes)]
-
-            if len(planes) > 3:
-                planes = planes[:3]
-            elif len(planes) < 3:
+        elif geometry.rgb_channel_count > 1:
+            n_planes = min(geometry.rgb_channel_count, 3)
+            rdr = self.get_channel_separator()
+            image = make_color_image(3)
+            for i in range(n_planes):
+                plane = np.frombuffer(
+                    self.open_bytes(rdr, rdr.getIndex(z,i,t), channel_bytes, XYWH),
+                    dtype)
+                plane.shape = (height, width)
+                store(image[:, :, i], plane)
+            if n_planes < 3:
                 # > 1 and < 3 means must be 2
                 # see issue #775
-                planes.append(np.zeros(planes[0].shape, planes[0].dtype))
-            image = np.dstack(planes)
-            image.shape=(height, width, 3)
+                image[:, :, 2] = 0
+            is_stored = True
             del rdr
-        elif self.rdr.getSizeC() > 1:
-            images = [
-                np.frombuffer(openBytes_func(self.rdr.getIndex(z,i,t)), dtype)
-                      for i in range(self.rdr.getSizeC())]
-            image = np.dstack(images)
-            image.shape = (height, width, self.rdr.getSizeC())
-            if not channel_names is None:
+        elif geometry.size_c > 1:
+            n_planes = geometry.size_c
+            image = make_color_image(n_planes)
+            for i in range(n_planes):
+                plane = np.frombuffer(
+                    openBytes_func(self.rdr.getIndex(z,i,t)), dtype)
+                plane.shape = (height, width)
+                store(image[:, :, i], plane)
+            is_stored = True
+            if not channel_names is None and self.metadata is None:
+                # The reader was made without an OME-XML metadata store
+                channel_names.extend([None] * geometry.size_c)
+            elif not channel_names is None:
                 metadata = metadatatools.MetadataRetrieve(self.metadata)
-                for i in range(self.rdr.getSizeC()):
+                for i in range(geometry.size_c):
                     index = self.rdr.getIndex(z, 0, t)
                     channel_name = metadata.getChannelName(index, i)
                     if channel_name is None:
                         channel_name = metadata.getChannelID(index, i)
                     channel_names.append(channel_name)
-        elif self.rdr.isIndexed():
+        elif geometry.is_indexed:
             #
             # The image data is indexes into a color lookup-table
             # But sometimes the table is the identity table and just generates
@@ -856,6 +2580,7 @@ class ImageReader(object):
             #
             index = self.rdr.getIndex(z,0,t)
             image = np.frombuffer(openBytes_func(index),dtype)
+            FormatTools = make_format_tools_class()
             if pixel_type in (FormatTools.INT16, FormatTools.UINT16):
                 lut = self.rdr.get16BitLookupTable()
                 if lut is not None:
@@ -879,12 +2604,705 @@ class ImageReader(object):
             image = np.frombuffer(openBytes_func(index),dtype)
             image.shape = (height,width)
 
-        if rescale:
-            image = image.astype(np.float32) / float(scale)
+        if not is_stored:
+            if out is not None:
+                store(out, image)
+                image = out
+            elif rescale:
+                image = np.divide(image, float(scale), dtype=np.float32)
+            elif not image.flags.writeable:
+                # A view of a plane in the plane cache
+                image = image.copy()
         if wants_max_intensity:
             return image, scale
         return image
 
+    def enable_prefetch(self, depth = DEFAULT_PREFETCH_DEPTH, plan = None):
+        '''Decode the planes that will be read next on a background thread
+
+        :param depth: the # of planes to decode ahead of :meth:`read`.
+        :param plan: the planes in the order they will be read, as a
+                  sequence of dictionaries of keyword arguments to
+                  :meth:`read`, for instance
+                  ``[dict(z=z, c=c) for z in range(10) for c in range(2)]``.
+                  If `None`, the reader predicts the next planes when
+                  successive reads step through z, c, t or index.
+
+        The reader's Java object is only used by one thread at a time, so
+        the prefetch thread decodes while the caller is busy with the
+        planes already read. Reads that pass `channel_names` bypass the
+        prefetcher. See :meth:`get_prefetch_stats`.
+        '''
+        self.disable_prefetch()
+        if plan is not None:
+            with self.__lock:
+                plan = [self.__get_prefetch_key(**kwargs) for kwargs in plan]
+        self.__prefetcher = PlanePrefetcher(
+            self.__read_prefetch_key, depth, plan)
+
+    def disable_prefetch(self):
+        '''Stop prefetching planes and drop the planes already decoded'''
+        prefetcher, self.__prefetcher = self.__prefetcher, None
+        if prefetcher is not None:
+            prefetcher.close()
+
+    def get_prefetch_stats(self):
+        '''Get the statistics of the prefetcher or None if it is disabled
+
+        See :meth:`PlanePrefetcher.get_stats`.
+        '''
+        prefetcher = self.__prefetcher
+        if prefetcher is None:
+            return None
+        return prefetcher.get_stats()
+
+    def __get_prefetch_key(self, c = None, z = 0, t = 0, series = None,
+                           index = None, rescale = True, XYWH = None,
+                           resolution = None):
+        if series is None:
+            series = self.rdr.getSeries()
+        if resolution is None:
+            resolution = self.rdr.getResolution()
+        if XYWH is not None:
+            XYWH = tuple(XYWH)
+        return (series, resolution, index, c, z, t, XYWH, rescale)
+
+    def __get_prefetch_successors(self, key, last_key, depth):
+        #
+        # Predict the planes after this one if it is one step along z, c, t
+        # or index from the last plane read
+        #
+        if last_key is None or key[:2] != last_key[:2] or \
+           key[6:] != last_key[6:]:
+            return []
+        steps = [(axis, key[axis], last_key[axis]) for axis in range(2, 6)
+                 if key[axis] != last_key[axis]]
+        if len(steps) != 1 or steps[0][1] is None or steps[0][2] is None:
+            return []
+        axis, value, last_value = steps[0]
+        step = value - last_value
+        geometry = self.get_geometry(key[0], key[1])
+        if axis == 2:
+            size = self.rdr.getImageCount()
+        else:
+            size = (geometry.size_c, geometry.size_z, geometry.size_t)[axis - 3]
+        successors = []
+        for i in range(1, depth + 1):
+            value += step
+            if value < 0 or value >= size:
+                break
+            successors.append(key[:axis] + (value, ) + key[axis + 1:])
+        return successors
+
+    def __read_prefetch_key(self, key):
+        series, resolution, index, c, z, t, XYWH, rescale = key
+        with self.__lock:
+            #
+            # Leave the caller's series and resolution selected
+            #
+            current_series = self.rdr.getSeries()
+            current_resolution = self.rdr.getResolution()
+            try:
+                return self.__read(c, z, t, series, index, rescale, False,
+                                   None, XYWH, None, resolution)
+            finally:
+                self.get_geometry(current_series, current_resolution)
+
+    def read_stack(self, z = None, c = None, t = None, series = None,
+                   rescale = True, wants_max_intensity = False, XYWH=None,
+                   out = None, resolution = None):
+        '''Read a stack of planes into a single 5-d array.
+
+        :param z: the z indices to read: a single index, a sequence or range
+            of indices or `None` to read all of them.
+        :param c: the channel indices to read, given as for `z`. The channels
+            of RGB images are read as separate planes.
+        :param t: the time indices to read, given as for `z`.
+        :param series: series for ``.flex`` and similar multi-stack formats
+        :param rescale: `True` to rescale the intensity scale to 0 and 1; `False` to
+                  return the raw values native to the file.
+        :param wants_max_intensity: if `False`, only return the stack; if `True`,
+                  return a tuple of stack and max intensity
+        :param XYWH: a (x, y, w, h) tuple to read only that region of each plane
+        :param out: an array of the stack's shape to read the stack into.
+                  It must have a floating-point dtype if `rescale` is
+                  `True`; otherwise TypeError is raised.
+        :param resolution: the resolution level to read, as for :meth:`read`
+
+        :returns: an array of shape (T, Z, C, Y, X). Indexed images are
+            returned as their raw indexes.
+        '''
+        check_out_dtype(out, rescale)
+        with self.__lock:
+            geometry = self.get_geometry(series, resolution)
+            dtype, scale = geometry.dtype, geometry.scale
+            if geometry.rgb_channel_count > 1:
+                rdr = self.get_channel_separator()
+            else:
+                rdr = self.rdr
+            if XYWH is not None:
+                assert isinstance(XYWH, tuple) and len(XYWH) == 4, \
+                    "Invalid XYWH tuple"
+                width, height = XYWH[2], XYWH[3]
+            else:
+                width, height = geometry.size_x, geometry.size_y
+            plane_bytes = width * height * dtype.itemsize
+            openBytes_func = lambda x: self.open_bytes(
+                rdr, x, plane_bytes, XYWH)
+            t_indices = get_stack_indices(t, geometry.size_t)
+            z_indices = get_stack_indices(z, geometry.size_z)
+            c_indices = get_stack_indices(c, geometry.size_c)
+            shape = (len(t_indices), len(z_indices), len(c_indices),
+                     height, width)
+            if out is None:
+                stack = np.empty(shape, np.float32 if rescale else dtype)
+            elif tuple(out.shape) != shape:
+                raise ValueError(
+                    "The output array's shape is %s, but the stack's is %s" %
+                    (repr(tuple(out.shape)), repr(shape)))
+            else:
+                stack = out
+            for t_idx, tt in enumerate(t_indices):
+                for z_idx, zz in enumerate(z_indices):
+                    for c_idx, cc in enumerate(c_indices):
+                        plane = np.frombuffer(
+                            openBytes_func(rdr.getIndex(zz, cc, tt)), dtype)
+                        plane.shape = (height, width)
+                        if rescale:
+                            np.divide(plane, float(scale),
+                                      out=stack[t_idx, z_idx, c_idx],
+                                      dtype=np.float32)
+                        else:
+                            stack[t_idx, z_idx, c_idx] = plane
+            if wants_max_intensity:
+                return stack, scale
+            return stack
+
+    def iter_tiles(self, series = None, z = 0, c = None, t = 0,
+                   tile_shape = None, rescale = True, resolution = None):
+        '''Read a plane tile by tile.
+
+        :param series: series for ``.flex`` and similar multi-stack formats
+        :param z: z-stack index
+        :param c: read from this channel. `None` = read color image if multichannel
+            or interleaved RGB.
+        :param t: time index
+        :param tile_shape: the (height, width) of a tile. `None` uses the
+            reader's optimal tile size, which matches the way the plane is
+            stored so that no part of the file is decoded twice.
+        :param rescale: `True` to rescale the intensity scale to 0 and 1; `False` to
+                  return the raw values native to the file.
+        :param resolution: the resolution level to read, as for :meth:`read`
+
+        Yields a tuple of the x and y offsets of each tile and the tile
+        itself, row by row. Tiles at the right and bottom edges are cropped
+        to the plane.
+        '''
+        with self.__lock:
+            geometry = self.get_geometry(series, resolution)
+            if tile_shape is None:
+                tile_height = self.rdr.getOptimalTileHeight()
+                tile_width = self.rdr.getOptimalTileWidth()
+            else:
+                tile_height, tile_width = tile_shape
+        #
+        # Don't hold the lock while the caller has a tile. Each read takes
+        # it, and names the series and resolution, in case another thread
+        # selects others in between.
+        #
+        width, height = geometry.size_x, geometry.size_y
+        for y in range(0, height, tile_height):
+            h = min(tile_height, height - y)
+            for x in range(0, width, tile_width):
+                w = min(tile_width, width - x)
+                yield x, y, self.read(c = c, z = z, t = t,
+                                      series = geometry.series,
+                                      rescale = rescale, XYWH = (x, y, w, h),
+                                      resolution = geometry.resolution)
+
+    def as_array(self, series = 0, rescale = False):
+        '''Get a lazy 5-d array view of a series
+
+        :param series: the series to view
+        :param rescale: `True` to rescale the intensity scale to 0 and 1; `False` to
+                  return the raw values native to the file.
+
+        :returns: an :class:`ImageReaderArray` of shape (T, Z, C, Y, X) that
+                  reads planes only when it is indexed.
+        '''
+        return ImageReaderArray(self, series, rescale)
+
+class ImageReaderArray(object):
+    '''A lazy (T, Z, C, Y, X) array over the planes of an image series
+
+    Indexing the array with integers, slices or an ellipsis reads only the
+    planes and the bounding rectangle of the pixels that are selected,
+    for instance::
+
+        arr = reader.as_array()
+        arr[5, :, 0, 100:200, 100:200]
+
+    reads a 100 x 100 region from each z-plane of channel 0 at t = 5. The
+    T, Z and C dimensions can also be indexed with a sequence of indices;
+    each sequence selects along its own dimension, as in h5py, rather than
+    being broadcast against the others. The channels of RGB images are
+    separate planes.
+
+    The array reads through the reader's :meth:`ImageReader.get_geometry`
+    and :meth:`ImageReader.read_stack`, which hold the reader's lock, so it
+    can be used while the reader prefetches planes.
+    '''
+    ndim = 5
+
+    def __init__(self, reader, series = 0, rescale = False):
+        self.reader = reader
+        self.series = series
+        self.rescale = rescale
+        geometry = reader.get_geometry(series)
+        self.shape = (geometry.size_t, geometry.size_z, geometry.size_c,
+                      geometry.size_y, geometry.size_x)
+        self.dtype = np.dtype(np.float32 if rescale else geometry.dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype = None):
+        image = self[...]
+        if dtype is not None:
+            image = image.astype(dtype)
+        return image
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, )
+        if any([k is Ellipsis for k in key]):
+            idx = [i for i, k in enumerate(key) if k is Ellipsis][0]
+            fill = (slice(None), ) * (self.ndim - len(key) + 1)
+            key = key[:idx] + fill + key[idx+1:]
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for a %d-d array" % self.ndim)
+        key = key + (slice(None), ) * (self.ndim - len(key))
+        indices = []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, slice):
+                indices.append(list(range(*k.indices(size))))
+            elif isinstance(k, numbers.Integral):
+                indices.append([self.__check_index(k, size)])
+            else:
+                indices.append([self.__check_index(i, size) for i in k])
+        t_indices, z_indices, c_indices, y_indices, x_indices = indices
+        shape = [len(i) for i in indices]
+        if min(shape) == 0:
+            image = np.zeros(shape, self.dtype)
+        else:
+            #
+            # Read the bounding rectangle of the selected pixels, then
+            # pick the pixels out of it.
+            #
+            x0, y0 = min(x_indices), min(y_indices)
+            XYWH = (x0, y0, max(x_indices) - x0 + 1, max(y_indices) - y0 + 1)
+            image = self.reader.read_stack(
+                z = z_indices, c = c_indices, t = t_indices,
+                series = self.series, rescale = self.rescale, XYWH = XYWH)
+            y_key = self.__get_sub_key(key[3], y_indices, y0)
+            x_key = self.__get_sub_key(key[4], x_indices, x0)
+            image = image[:, :, :, y_key, :][:, :, :, :, x_key]
+        squeeze = tuple([i for i, k in enumerate(key)
+                         if isinstance(k, numbers.Integral)])
+        if len(squeeze) > 0:
+            image = image.reshape(
+                [n for i, n in enumerate(image.shape) if i not in squeeze])
+        return image
+
+    @staticmethod
+    def __check_index(index, size):
+        if index < -size or index >= size:
+            raise IndexError("index %d is out of bounds for size %d" %
+                             (index, size))
+        return index % size
+
+    @staticmethod
+    def __get_sub_key(k, indices, origin):
+        '''Get the key that picks the selected pixels out of the rectangle'''
+        if isinstance(k, slice) and (k.step is None or k.step > 0):
+            return slice(indices[0] - origin, indices[-1] - origin + 1, k.step)
+        return np.array(indices) - origin
+
+class ImageReaderPool(object):
+    '''A pool of image readers of one file, for reading it from several threads
+
+    An image reader wraps a stateful Java reader, so only one thread at a
+    time can use it. The pool hands out independent readers of the same
+    file, creating them as they are needed, up to `max_readers` of them.
+    Readers that have been idle for `idle_timeout` seconds are closed by a
+    background thread, attached to the JVM, that runs while any reader is
+    idle. :meth:`acquire` also closes them before reusing a reader.
+
+    Use it like this:
+
+    >>> with ImageReaderPool(path, max_readers=4) as pool:
+    >>>     images = pool.read_many([dict(series=s) for s in range(n)])
+
+    or call :meth:`acquire` and :meth:`release` from your own threads,
+    which must be attached to the JVM.
+
+    path - the path of the file to read
+
+    url - the URL of the file to read, if not a path
+
+    max_readers - the most readers the pool will create
+
+    idle_timeout - close readers that haven't been used for this many seconds
+
+    Other keyword arguments are passed to :class:`ImageReader`.
+    '''
+    def __init__(self, path = None, url = None, max_readers = 4,
+                 idle_timeout = 60.0, **kwargs):
+        self.path = path
+        self.url = url
+        self.max_readers = max_readers
+        self.idle_timeout = idle_timeout
+        self.kwargs = kwargs
+        self.__idle_readers = []
+        self.__n_readers = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__evicting_thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_class, value, traceback):
+        self.close()
+
+    def acquire(self):
+        '''Get a reader for the calling thread's exclusive use
+
+        Waits for a reader to be released if the pool's readers are all
+        in use. Call :meth:`release` when done with the reader.
+        '''
+        with self.__condition:
+            stale_readers = self.__pop_idle_readers()
+            self.__n_readers -= len(stale_readers)
+            reader = None
+            while True:
+                if self.__closed:
+                    break
+                if len(self.__idle_readers) > 0:
+                    release_time, reader = self.__idle_readers.pop()
+                    break
+                if self.__n_readers < self.max_readers:
+                    self.__n_readers += 1
+                    break
+                self.__condition.wait()
+        for stale_reader in stale_readers:
+            stale_reader.close()
+        if self.__closed and reader is None:
+            raise ValueError("The image reader pool is closed")
+        if reader is not None:
+            return reader
+        try:
+            return ImageReader(path=self.path, url=self.url, **self.kwargs)
+        except:
+            with self.__condition:
+                self.__n_readers -= 1
+                self.__condition.notify()
+            raise
+
+    def release(self, reader):
+        '''Give a reader obtained from :meth:`acquire` back to the pool'''
+        with self.__condition:
+            if self.__closed:
+                stale_readers = [reader]
+            else:
+                self.__idle_readers.append((time.time(), reader))
+                stale_readers = self.__pop_idle_readers()
+                self.__start_evicting_thread()
+            self.__n_readers -= len(stale_readers)
+            self.__condition.notify_all()
+        for stale_reader in stale_readers:
+            stale_reader.close()
+
+    def __start_evicting_thread(self):
+        # Call with the condition held
+        if self.__evicting_thread is None:
+            self.__evicting_thread = threading.Thread(
+                target=self.__evict_idle_readers,
+                name="ImageReaderPool idle reader eviction")
+            self.__evicting_thread.daemon = True
+            self.__evicting_thread.start()
+
+    def __evict_idle_readers(self):
+        #
+        # Close idle readers as they time out, until none are idle
+        #
+        jutil.attach()
+        try:
+            while True:
+                with self.__condition:
+                    stale_readers = self.__pop_idle_readers()
+                    self.__n_readers -= len(stale_readers)
+                    if len(stale_readers) > 0:
+                        self.__condition.notify_all()
+                    elif self.__closed or len(self.__idle_readers) == 0:
+                        self.__evicting_thread = None
+                        return
+                    else:
+                        oldest_release_time = self.__idle_readers[0][0]
+                        self.__condition.wait(max(
+                            oldest_release_time + self.idle_timeout -
+                            time.time(), .01))
+                        continue
+                for stale_reader in stale_readers:
+                    stale_reader.close()
+        finally:
+            jutil.detach()
+
+    def evict_idle(self):
+        '''Close the readers that have been idle for longer than idle_timeout'''
+        with self.__condition:
+            stale_readers = self.__pop_idle_readers()
+            self.__n_readers -= len(stale_readers)
+        for stale_reader in stale_readers:
+            stale_reader.close()
+
+    def __pop_idle_readers(self):
+        # The idle readers are kept in the order they were released
+        oldest = time.time() - self.idle_timeout
+        n_stale = 0
+        while n_stale < len(self.__idle_readers) and \
+              self.__idle_readers[n_stale][0] < oldest:
+            n_stale += 1
+        stale_readers = [reader for release_time, reader
+                         in self.__idle_readers[:n_stale]]
+        del self.__idle_readers[:n_stale]
+        return stale_readers
+
+    def get_reader_count(self):
+        '''The number of open readers, both idle and in use'''
+        with self.__condition:
+            return self.__n_readers
+
+    def read_many(self, planes, n_threads = None):
+        '''Read many planes of the file in parallel
+
+        planes - a sequence of dictionaries of keyword arguments to
+                 :meth:`ImageReader.read`, one per plane, for instance
+                 ``[dict(series=1, z=z, rescale=False) for z in range(10)]``
+
+        n_threads - the number of threads to read with. Defaults to the
+                    pool's `max_readers`.
+
+        Returns a list of the images in the order of `planes`.
+        '''
+        planes = list(planes)
+        if n_threads is None:
+            n_threads = self.max_readers
+        n_threads = max(1, min(n_threads, len(planes)))
+        work = queue.Queue()
+        for i in range(len(planes)):
+            work.put(i)
+        images = [None] * len(planes)
+        errors = []
+
+        def fn():
+            jutil.attach()
+            try:
+                reader = self.acquire()
+                try:
+                    while len(errors) == 0:
+                        try:
+                            i = work.get_nowait()
+                        except queue.Empty:
+                            break
+                        images[i] = reader.read(**planes[i])
+                finally:
+                    self.release(reader)
+            except:
+                logger.debug("Failed to read plane", exc_info=True)
+                errors.append(sys.exc_info()[1])
+            finally:
+                jutil.detach()
+
+        threads = [threading.Thread(target=fn) for _ in range(n_threads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return images
+
+    def close(self):
+        '''Close the pool's idle readers and close the rest when released'''
+        with self.__condition:
+            self.__closed = True
+            stale_readers = [reader for release_time, reader
+                             in self.__idle_readers]
+            del self.__idle_readers[:]
+            self.__n_readers -= len(stale_readers)
+            self.__condition.notify_all()
+        for stale_reader in stale_readers:
+            stale_reader.close()
+
+class ImageReaderPipeline(object):
+    '''Open the image readers of a list of files ahead of their use
+
+    Finding the reader of a file and parsing its header can take as long
+    as analyzing its images. A pipeline opens the readers of the next
+    `lookahead` files on a background thread, attached to the JVM, while
+    the caller works on the current file. Use it like this:
+
+    >>> with ImageReaderPipeline(paths, lookahead=2) as pipeline:
+    >>>     for reader in pipeline:
+    >>>         image = reader.read()
+
+    The readers are handed out in the order of `paths`. A reader belongs
+    to the pipeline, which closes it when the next reader is taken or when
+    the pipeline is closed, along with any readers that were opened but
+    never taken. If a file can't be opened, the error is raised when its
+    reader is taken.
+
+    paths - the paths of the files to open, in the order they will be used
+
+    lookahead - the most readers to open ahead of the one in use
+
+    Other keyword arguments are passed to :class:`ImageReader`.
+    '''
+    def __init__(self, paths, lookahead = 2, **kwargs):
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1")
+        self.paths = list(paths)
+        self.lookahead = lookahead
+        self.kwargs = kwargs
+        self.__readers = {}
+        self.__next_index = 0
+        self.__current_reader = None
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="ImageReaderPipeline")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_class, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            reader = self.next_reader()
+            if reader is None:
+                return
+            yield reader
+
+    def __run(self):
+        jutil.attach()
+        try:
+            for index, path in enumerate(self.paths):
+                with self.__condition:
+                    while not self.__closed and \
+                          index >= self.__next_index + self.lookahead:
+                        self.__condition.wait()
+                    if self.__closed:
+                        break
+                reader, error = None, None
+                try:
+                    reader = ImageReader(path, **self.kwargs)
+                except:
+                    logger.debug("Failed to open %s" % path, exc_info=True)
+                    error = sys.exc_info()[1]
+                with self.__condition:
+                    if not self.__closed:
+                        self.__readers[index] = (reader, error)
+                        self.__condition.notify_all()
+                        continue
+                if reader is not None:
+                    reader.close()
+                break
+        finally:
+            jutil.detach()
+
+    def next_reader(self):
+        '''Take the reader of the next file
+
+        Closes the reader taken before. Returns None after the last file.
+        Raises the error that opening the file raised, if any.
+        '''
+        self.__close_current_reader()
+        with self.__condition:
+            if self.__closed:
+                raise ValueError("The pipeline is closed")
+            index = self.__next_index
+            if index >= len(self.paths):
+                return None
+            while index not in self.__readers:
+                if self.__closed:
+                    raise ValueError("The pipeline is closed")
+                self.__condition.wait()
+            reader, error = self.__readers.pop(index)
+            self.__next_index = index + 1
+            self.__condition.notify_all()
+        if error is not None:
+            raise error
+        self.__current_reader = reader
+        return reader
+
+    def __close_current_reader(self):
+        reader, self.__current_reader = self.__current_reader, None
+        if reader is not None:
+            reader.close()
+
+    def get_ready_count(self):
+        '''Get the # of readers opened ahead and not yet taken'''
+        with self.__condition:
+            return len(self.__readers)
+
+    def close(self):
+        '''Close the reader in use and the readers that were never taken'''
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+        self.__close_current_reader()
+        with self.__condition:
+            unused = [reader for reader, error in self.__readers.values()
+                      if reader is not None]
+            self.__readers.clear()
+        for reader in unused:
+            reader.close()
+
+def get_stack_indices(indices, size):
+    '''Convert a read_stack index argument into a list of indices
+
+    indices - a single index, a sequence of indices or None for all
+
+    size - the size of the dimension
+    '''
+    if indices is None:
+        return list(range(size))
+    if isinstance(indices, numbers.Integral):
+        return [indices]
+    return list(indices)
+
+def check_out_dtype(out, rescale):
+    '''Make sure that an output array can hold the image that is read into it
+
+    out - the output array or None
+
+    rescale - True if the image is rescaled to values between 0 and 1, which
+              only a floating-point array can hold
+    '''
+    if out is not None and rescale and \
+       not np.issubdtype(out.dtype, np.floating):
+        raise TypeError(
+            "The output array's dtype is %s, but a rescaled image needs a "
+            "floating-point array. Pass rescale=False to read raw values "
+            "into it." % out.dtype)
+
 ###################
 #
 # A cache mechanism for image readers
@@ -901,8 +3319,140 @@ class ImageReader(object):
 # This allows us to have two keys point to the same reader, e.g. read
 # multiple channels from a stack.
 __image_reader_key_cache = {}
-# The image reader cache associates path/url with a reader
-__image_reader_cache = {}
+# The image reader cache associates path/url with a cache entry. Entries
+# are kept in least to most recently used order, and entries that no key
+# uses are kept open until there are too many.
+__image_reader_cache = collections.OrderedDict()
+__image_reader_cache_hits = 0
+__image_reader_cache_misses = 0
+__image_reader_cache_evictions = 0
+# The lock guards the caches. The path/urls of readers being constructed
+# are pending, and threads that want them wait on the lock's condition.
+__image_reader_cache_lock = threading.Condition(threading.RLock())
+__image_reader_cache_pending = set()
+
+'''The default most readers that the image reader cache keeps'''
+DEFAULT_MAX_CACHED_READERS = 16
+'''The default most readers in the image reader cache with open files'''
+DEFAULT_MAX_OPEN_READER_FILES = 16
+
+__max_cached_readers = DEFAULT_MAX_CACHED_READERS
+__max_open_reader_files = DEFAULT_MAX_OPEN_READER_FILES
+
+class ImageReaderCacheEntry(object):
+    '''An image reader in the image reader cache
+
+    rdr - the image reader
+
+    use_count - the # of keys that use the reader
+
+    signature - the modification time and size of the reader's file
+                when it was last initialized
+
+    is_file_open - False if the reader's files were closed to stay within
+                   the open file limit.
+    '''
+    def __init__(self, rdr):
+        self.rdr = rdr
+        self.use_count = 0
+        self.signature = get_file_signature(rdr.path)
+        self.is_file_open = True
+
+def get_file_signature(path):
+    '''Get the modification time and size of a file or None if it has none'''
+    try:
+        stat = os.stat(path)
+    except (OSError, IOError, TypeError):
+        return None
+    return stat.st_mtime, stat.st_size
+
+def set_image_reader_cache_limits(max_readers = DEFAULT_MAX_CACHED_READERS,
+                                  max_open_files = DEFAULT_MAX_OPEN_READER_FILES):
+    '''Limit the size of the image reader cache
+
+    max_readers - the most readers to keep. The least recently used
+                  readers that no key uses are closed to stay within it.
+
+    max_open_files - the most readers whose files are open. The least
+                     recently used readers that no key uses close their
+                     files, keeping their state, to stay within it.
+
+    Readers that are in use are never closed, so the cache can exceed
+    the limits if that many keys are in use.
+    '''
+    global __max_cached_readers, __max_open_reader_files
+    with __image_reader_cache_lock:
+        __max_cached_readers = max_readers
+        __max_open_reader_files = max_open_files
+        evictions = enforce_image_reader_cache_limits()
+    close_image_reader_cache_evictions(evictions)
+
+def get_image_reader_cache_stats():
+    '''Get the image reader cache's statistics
+
+    Returns a dictionary of the # of hits, misses and evictions, the # of
+    readers in the cache (size), the # of them that no key uses (idle)
+    and the # of them with open files (open_files).
+    '''
+    with __image_reader_cache_lock:
+        entries = list(__image_reader_cache.values())
+        return dict(hits = __image_reader_cache_hits,
+                    misses = __image_reader_cache_misses,
+                    evictions = __image_reader_cache_evictions,
+                    size = len(entries),
+                    idle = len([entry for entry in entries
+                                if entry.use_count == 0]),
+                    open_files = len([entry for entry in entries
+                                      if entry.is_file_open]))
+
+def enforce_image_reader_cache_limits():
+    '''Choose idle readers or files to close to bring the cache within its limits
+
+    The caller must hold the cache lock. Evicted readers are removed from
+    the cache, and readers whose files are to be closed are marked
+    pending. Closing them is left to the caller, who must pass the
+    returned list to :func:`close_image_reader_cache_evictions` after
+    releasing the lock.
+    '''
+    global __image_reader_cache_evictions
+    evictions = []
+    idle_entries = [(path_url, entry) for path_url, entry
+                    in __image_reader_cache.items()
+                    if entry.use_count == 0 and
+                    path_url not in __image_reader_cache_pending]
+    n_extra = len(__image_reader_cache) - __max_cached_readers
+    for path_url, entry in idle_entries[:max(n_extra, 0)]:
+        del __image_reader_cache[path_url]
+        evictions.append((None, entry))
+        __image_reader_cache_evictions += 1
+    n_open = len([entry for entry in __image_reader_cache.values()
+                  if entry.is_file_open])
+    for path_url, entry in idle_entries[max(n_extra, 0):]:
+        if n_open <= __max_open_reader_files:
+            break
+        if entry.is_file_open:
+            __image_reader_cache_pending.add(path_url)
+            entry.is_file_open = False
+            evictions.append((path_url, entry))
+            n_open -= 1
+    return evictions
+
+def close_image_reader_cache_evictions(evictions):
+    '''Close the readers and files chosen by enforce_image_reader_cache_limits
+
+    The caller must not hold the cache lock, so that closing readers,
+    which runs the Java garbage collector, doesn't hold up other threads.
+    '''
+    for path_url, entry in evictions:
+        if path_url is None:
+            entry.rdr.close()
+            continue
+        try:
+            entry.rdr.close_file()
+        finally:
+            with __image_reader_cache_lock:
+                __image_reader_cache_pending.discard(path_url)
+                __image_reader_cache_lock.notify_all()
 
 def get_image_reader(key, path=None, url=None):
     '''Make or find an image reader appropriate for the given path
@@ -911,42 +3461,152 @@ def get_image_reader(key, path=None, url=None):
 
     key - use this key to keep only a single cache member associated with
           that key open at a time.
+
+    Readers are reinitialized if their file's modification time or size
+    changes. See :func:`set_image_reader_cache_limits` for how many
+    readers are kept.
+
+    The cache can be used from several threads. Threads that ask for a
+    reader that another thread is making, reinitializing or reopening
+    wait for it rather than making one of their own. Readers are made,
+    reinitialized, reopened and closed without holding the cache's lock,
+    so requests for other files are not held up.
+    '''
+    global __image_reader_cache_hits, __image_reader_cache_misses
+    evictions = []
+    with __image_reader_cache_lock:
+        while (path, url) in __image_reader_cache_pending:
+            __image_reader_cache_lock.wait()
+        entry = None
+        if key in __image_reader_key_cache:
+            old_path, old_url = __image_reader_key_cache[key]
+            if old_path == path and old_url == url:
+                entry = __image_reader_cache.pop((path, url))
+                __image_reader_cache[path, url] = entry
+            else:
+                evictions += release_key(key)
+        if entry is None:
+            entry = __image_reader_cache.get((path, url))
+            if entry is not None:
+                evictions += use_cached_image_reader(key, path, url, entry)
+        if entry is not None:
+            __image_reader_cache_hits += 1
+        else:
+            __image_reader_cache_misses += 1
+        __image_reader_cache_pending.add((path, url))
+    close_image_reader_cache_evictions(evictions)
+    #
+    # Make or prepare the reader without holding the lock, so that threads
+    # that want other readers don't wait for this one.
+    #
+    try:
+        if entry is None:
+            entry = ImageReaderCacheEntry(ImageReader(path=path, url=url))
+            is_new = True
+        else:
+            is_new = False
+            prepare_cached_image_reader(entry)
+    except:
+        with __image_reader_cache_lock:
+            __image_reader_cache_pending.discard((path, url))
+            __image_reader_cache_lock.notify_all()
+            if entry is not None:
+                forget_cached_image_reader(entry)
+        if entry is not None:
+            entry.rdr.close()
+        raise
+    with __image_reader_cache_lock:
+        __image_reader_cache_pending.discard((path, url))
+        __image_reader_cache_lock.notify_all()
+        if is_new:
+            evictions = use_cached_image_reader(key, path, url, entry)
+        else:
+            evictions = enforce_image_reader_cache_limits()
+    close_image_reader_cache_evictions(evictions)
+    return entry.rdr
+
+def use_cached_image_reader(key, path, url, entry):
+    '''Make an entry the most recently used one and have a key use it
+
+    The caller must hold the cache lock, and must pass the returned
+    evictions to :func:`close_image_reader_cache_evictions` after
+    releasing it.
     '''
+    evictions = []
+    __image_reader_cache.pop((path, url), None)
+    __image_reader_cache[path, url] = entry
+    entry.use_count += 1
     if key in __image_reader_key_cache:
-        old_path, old_url = __image_reader_key_cache[key]
-        old_count, rdr = __image_reader_cache[old_path, old_url]
-        if old_path == path and old_url == url:
-            return rdr
-        release_image_reader(key)
-    if (path, url) in __image_reader_cache:
-        old_count, rdr = __image_reader_cache[path, url]
-    else:
-        rdr = ImageReader(path=path, url=url)
-        old_count = 0
-    __image_reader_cache[path, url] = (old_count+1, rdr)
+        # Another thread used the key while this one made the reader
+        evictions += release_key(key)
     __image_reader_key_cache[key] = (path, url)
-    return rdr
+    return evictions + enforce_image_reader_cache_limits()
+
+def forget_cached_image_reader(entry):
+    '''Remove an entry and the keys that use it from the cache
+
+    The caller must hold the cache lock and close the entry's reader.
+    '''
+    for key, path_url in list(__image_reader_key_cache.items()):
+        if __image_reader_cache.get(path_url) is entry:
+            del __image_reader_key_cache[key]
+    for path_url, other in list(__image_reader_cache.items()):
+        if other is entry:
+            del __image_reader_cache[path_url]
+
+def prepare_cached_image_reader(entry):
+    '''Reinitialize a cached reader if its file changed and reopen its files
+
+    The caller must not hold the cache lock, and must have marked the
+    entry's path and URL pending, so that no other thread uses it.
+    '''
+    signature = get_file_signature(entry.rdr.path)
+    if signature != entry.signature:
+        entry.rdr.rdr.close()
+        entry.rdr.init_reader()
+        entry.signature = signature
+        entry.is_file_open = True
+    elif not entry.is_file_open:
+        entry.rdr.reopen_file()
+        entry.is_file_open = True
+    return entry.rdr
+
+def release_key(key):
+    '''Stop a key from using its reader
+
+    The caller must hold the cache lock. Returns the evictions to pass to
+    :func:`close_image_reader_cache_evictions` after releasing it.
+    '''
+    path, url = __image_reader_key_cache.pop(key)
+    __image_reader_cache[path, url].use_count -= 1
+    return enforce_image_reader_cache_limits()
 
 def release_image_reader(key):
     '''Tell the cache that it should flush the reference for the given key
 
+    The reader is kept open for reuse while the cache is within its limits.
     '''
-    if key in __image_reader_key_cache:
-        path, url = __image_reader_key_cache[key]
-        del __image_reader_key_cache[key]
-        old_count, rdr = __image_reader_cache[path, url]
-        if old_count == 1:
-            rdr.close()
-            del __image_reader_cache[path, url]
-        else:
-            __image_reader_cache[path, url] = (old_count-1, rdr)
+    evictions = []
+    with __image_reader_cache_lock:
+        if key in __image_reader_key_cache:
+            evictions = release_key(key)
+    close_image_reader_cache_evictions(evictions)
 
 def clear_image_reader_cache():
     '''Get rid of any open image readers'''
-    for use_count, rdr in __image_reader_cache.values():
-        rdr.close()
-    __image_reader_cache.clear()
-    __image_reader_key_cache.clear()
+    global __image_reader_cache_hits, __image_reader_cache_misses, \
+           __image_reader_cache_evictions
+    with __image_reader_cache_lock:
+        while len(__image_reader_cache_pending) > 0:
+            __image_reader_cache_lock.wait()
+        entries = list(__image_reader_cache.values())
+        __image_reader_cache.clear()
+        __image_reader_key_cache.clear()
+        __image_reader_cache_hits = 0
+        __image_reader_cache_misses = 0
+        __image_reader_cache_evictions = 0
+    for entry in entries:
+        entry.rdr.close()
 
 def load_using_bioformats(path, c=None, z=0, t=0, series=None, index=None,
                           rescale = True,
@@ -967,38 +3627,107 @@ def load_using_bioformats(path, c=None, z=0, t=0, series=None, index=None,
         return rdr.read(c, z, t, series, index, rescale, wants_max_intensity,
                         channel_names)
 
+__omexml_cache = None
+
+def enable_omexml_cache(directory, max_bytes):
+    '''Keep the OME-XML metadata that get_omexml_metadata reads in a directory
+
+    directory - the directory to keep the metadata in
+
+    max_bytes - the most bytes of metadata to keep. The least recently used
+                entries are removed to stay within it.
+
+    The metadata of a file is cached under its path, size and
+    modification time and the version of Bio-Formats, so it is read again
+    if the file changes or Bio-Formats is upgraded. Only files given by
+    path are cached, not URLs.
+    '''
+    global __omexml_cache
+    __omexml_cache = DiskCache(directory, max_bytes)
+    return __omexml_cache
+
+def disable_omexml_cache():
+    '''Read the OME-XML metadata from the file on each get_omexml_metadata'''
+    global __omexml_cache
+    __omexml_cache = None
+
+def get_omexml_cache():
+    '''Get the OME-XML cache's DiskCache or None if it is not enabled'''
+    return __omexml_cache
+
+def get_omexml_cache_key(path):
+    '''Get the key of a file's entry in the OME-XML cache
+
+    Returns None if the file can't be found.
+    '''
+    signature = get_file_signature(path)
+    if signature is None:
+        return None
+    mtime, size = signature
+    return json.dumps([os.path.abspath(path), size, mtime,
+                       bioformats.JAR_VERSION])
+
 def get_omexml_metadata(path=None, url=None):
     '''Read the OME metadata from a file using Bio-formats
 
     :param path: path to the file
 
-    :param groupfiles: utilize the groupfiles option to take the directory structure
-                 into account.
+    :param url: URL of the file, if not a path
 
-    :returns: the metdata as XML.
+    :returns: the metdata as XML, including the file's original metadata.
 
+    The metadata is kept in the OME-XML cache if it is enabled (see
+    :func:`enable_omexml_cache`).
     '''
-    with ImageReader(path=path, url=url, perform_init=False) as rdr:
-        #
-        # Below, "in" is a keyword and Rhino's parser is just a little wonky I fear.
-        #
-        # It is critical that setGroupFiles be set to false, goodness knows
-        # why, but if you don't the series count is wrong for flex files.
-        #
-        script = """
-        importClass(Packages.loci.common.services.ServiceFactory,
-                    Packages.loci.formats.services.OMEXMLService,
-                    Packages.loci.formats['in'].DefaultMetadataOptions,
-                    Packages.loci.formats['in'].MetadataLevel);
-        reader.setGroupFiles(false);
-        reader.setOriginalMetadataPopulated(true);
-        var service = new ServiceFactory().getInstance(OMEXMLService);
-        var metadata = service.createOMEXMLMetadata();
-        reader.setMetadataStore(metadata);
-        reader.setMetadataOptions(new DefaultMetadataOptions(MetadataLevel.ALL));
-        reader.setId(path);
-        var xml = service.getOMEXML(metadata);
-        xml;
-        """
-        xml = jutil.run_script(script, dict(path=rdr.path, reader = rdr.rdr))
-        return xml
+    cache = get_omexml_cache()
+    key = None
+    if cache is not None and path is not None and url is None:
+        key = get_omexml_cache_key(path)
+    if key is not None:
+        cached_path = cache.get_path(key)
+        if cached_path is not None:
+            try:
+                with open(cached_path, "rb") as fd:
+                    return fd.read().decode("utf-8")
+            except (IOError, OSError):
+                # Evicted by another process since it was found
+                pass
+    #
+    # The reader's setId fills the metadata store, so one pass both
+    # detects the format and parses the metadata.
+    #
+    with ImageReader(path=path, url=url, original_metadata=True,
+                     memoize=False) as rdr:
+        xml = metadatatools.getOMEXML(rdr.metadata)
+    if key is not None:
+        try:
+            cache.put(key, xml.encode("utf-8"), name = "ome.xml")
+        except (IOError, OSError):
+            logger.warning("Failed to cache the OME-XML of %s" % path,
+                           exc_info=True)
+    return xml
+
+def get_omexml_and_reader(path=None, url=None, original_metadata=True,
+                          **kwargs):
+    '''Open a file and parse its OME metadata in one pass
+
+    :param path: path to the file
+
+    :param url: URL of the file, if not a path
+
+    :param original_metadata: `True` to keep the file's original metadata
+                  as annotations of the OME-XML metadata.
+
+    Other keyword arguments are passed to :class:`ImageReader`.
+
+    :returns: a tuple of the metadata as a :class:`bioformats.omexml.OMEXML`
+              and an :class:`ImageReader` that is ready to read pixels.
+              The caller should close the reader.
+    '''
+    rdr = ImageReader(path=path, url=url,
+                      original_metadata=original_metadata, **kwargs)
+    try:
+        return rdr.get_omexml(), rdr
+    except:
+        rdr.close()
+        raise
@@ -42,6 +42,7 @@ import javabridge as jutil
 import bioformats
 import javabridge as javabridge
 import bioformats.omexml as ome
+from .formatreader import cached_binding
 
 def write_image(pathname, pixels, pixel_type,
                 c = 0, z = 0, t = 0,
@@ -136,6 +137,7 @@ def convert_pixels_to_buffer(pixels, pixel_type):
     env = jutil.get_env()
     return env.make_byte_array(buf)
 
+@cached_binding
 def make_iformat_writer_class(class_name):
     '''Bind a Java class that implements IFormatWriter to a Python class
 
@@ -200,6 +202,7 @@ def make_iformat_writer_class(class_name):
 
     return IFormatWriter
 
+@cached_binding
 def make_image_writer_class():
     '''Return an image writer class for the given Java environment'''
     env = jutil.get_env()
@@ -248,6 +251,7 @@ def make_image_writer_class():
                                                  'Saves the given byte array to the current file.')
     return ImageWriter
 
+@cached_binding
 def make_ome_tiff_writer_class():
     '''Return a class that wraps loci.formats.out.OMETiffWriter'''
     class_name = 'loci/formats/out/OMETiffWriter'
@@ -275,6 +279,7 @@ def make_ome_tiff_writer_class():
 
     return OMETiffWriter
 
+@cached_binding
 def make_writer_wrapper_class(class_name):
     '''Make an ImageWriter wrapper class
 
@@ -298,6 +303,7 @@ def make_writer_wrapper_class(class_name):
     return WriterWrapper
 
 
+@cached_binding
 def make_format_writer_class(class_name):
     '''Make a FormatWriter wrapper class
 
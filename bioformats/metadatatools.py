@@ -22,6 +22,23 @@ def createOMEXMLMetadata():
     '''
     return jutil.static_call('loci/formats/MetadataTools', 'createOMEXMLMetadata', '()Lloci/formats/meta/IMetadata;')
 
+def getOMEXML(metadata):
+    '''Get the OME-XML of a metadata store, using the OMEXMLService
+
+    metadata - an OME-XML metadata store, for instance one returned by
+               createOMEXMLMetadata and filled by a reader's setId
+
+    Returns the metadata as a string of XML.
+    '''
+    factory = jutil.make_instance('loci/common/services/ServiceFactory', '()V')
+    service = jutil.call(
+        factory, 'getInstance',
+        '(Ljava/lang/Class;)Lloci/common/services/Service;',
+        jutil.class_for_name('loci.formats.services.OMEXMLService'))
+    return jutil.call(
+        service, 'getOMEXML',
+        '(Lloci/formats/meta/MetadataRetrieve;)Ljava/lang/String;', metadata)
+
 
 class MetadataStore(object):
     '''  '''
@@ -208,15 +225,15 @@ def wrap_imetadata_object(o):
 
     return IMetadata(o)
 
-__pixel_type_class = None
 def make_pixel_type_class():
     '''The class, ome.xml.model.enums.PixelType
 
     The Java class has enumerations for the various image data types
     such as UINT8 or DOUBLE
     '''
-    global __pixel_type_class
-    if __pixel_type_class is None:
+    from .formatreader import get_binding
+
+    def make_class():
         class PixelType(object):
             '''Provide enums from ome.xml.model.enums.PixelType'''
             def __init__(self):
@@ -232,8 +249,8 @@ def make_pixel_type_class():
                 self.DOUBLE = jutil.get_static_field(klass, 'DOUBLE', 'Lome/xml/model/enums/PixelType;')
                 self.COMPLEX = jutil.get_static_field(klass, 'COMPLEX', 'Lome/xml/model/enums/PixelType;')
                 self.DOUBLECOMPLEX = jutil.get_static_field(klass, 'DOUBLECOMPLEX', 'Lome/xml/model/enums/PixelType;')
-        __pixel_type_class = PixelType
-    return __pixel_type_class
+        return PixelType
+    return get_binding((__name__, "make_pixel_type_class"), make_class)
 
 MINIMUM = 'MINIMUM'
 NO_OVERLAYS = 'NO_OVERLAYS'
@@ -0,0 +1,175 @@
+# Python-bioformats is distributed under the GNU General Public
+# License, but this file is licensed under the more permissive BSD
+# license.  See the accompanying file LICENSE for details.
+#
+# Copyright (c) 2009-2014 Broad Institute
+# All rights reserved.
+
+'''parallel.py - load many images in parallel worker processes
+
+Each worker process runs its own Java VM, so decoding scales with the
+number of cores rather than being limited by one VM and the GIL. Workers
+hand the pixels of the images they decode back through shared memory
+blocks rather than pickling them.
+
+Example:
+    import bioformats.parallel
+
+    if __name__ == "__main__":
+        images = bioformats.parallel.load_images(paths, rescale=False,
+                                                 workers=8)
+
+The workers are started with the "spawn" method, so the script that calls
+:func:`load_images` must guard its main code as above.
+'''
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+logger = logging.getLogger(__name__)
+import multiprocessing
+import multiprocessing.util
+import numpy as np
+import uuid
+
+import javabridge
+import bioformats
+
+def start_worker_vm():
+    '''Start the Java VM of a worker process and kill it when the worker exits
+
+    The VM is killed by a multiprocessing finalizer rather than an atexit
+    handler: a worker joins its non-daemon threads, which include the VM's
+    monitor thread, before the interpreter runs atexit handlers, but after
+    it runs the finalizers.
+    '''
+    javabridge.start_vm(class_path=bioformats.JARS, run_headless=True)
+    multiprocessing.util.Finalize(None, javabridge.kill_vm, exitpriority=10)
+    bioformats.init_logger()
+
+def load_image_into_shared_memory(args):
+    '''Load an image in a worker process and copy it into shared memory
+
+    args - a tuple of the path of the image, a dictionary of keyword
+           arguments for :func:`bioformats.load_image` and the name of the
+           shared memory block to create
+
+    Returns the image's shape and dtype. The caller is responsible for
+    unlinking the block.
+    '''
+    from multiprocessing import shared_memory
+
+    path, kwargs, name = args
+    image = bioformats.load_image(path, **kwargs)
+    block = shared_memory.SharedMemory(
+        name=name, create=True, size=max(image.nbytes, 1))
+    try:
+        np.ndarray(image.shape, image.dtype, buffer=block.buf)[...] = image
+        return image.shape, image.dtype.str
+    finally:
+        block.close()
+
+def unlink_shared_memory(name):
+    '''Unlink a shared memory block by name, if it exists'''
+    from multiprocessing import shared_memory
+
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except (IOError, OSError):
+        return
+    block.close()
+    block.unlink()
+
+class SharedImages(list):
+    '''A list of images that are views of shared memory blocks
+
+    :func:`load_images` returns one of these when called with
+    ``copy=False``. Call :meth:`release` when done with the images, or use
+    the list as a context manager; the images must not be used after that.
+    '''
+    def __init__(self):
+        super(SharedImages, self).__init__()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_class, value, traceback):
+        self.release()
+
+    def release(self):
+        '''Free the shared memory blocks of the images'''
+        del self[:]
+        blocks, self.blocks = self.blocks, []
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # An image is still referenced; its memory is freed with it
+                pass
+            block.unlink()
+
+def load_images(paths, c=None, z=0, t=0, series=None, index=None,
+                rescale=True, workers=None, copy=True):
+    '''Load images using a pool of worker processes
+
+    paths - the paths of the images to load
+
+    c, z, t, series, index, rescale - as for :func:`bioformats.load_image`
+
+    workers - the number of worker processes to start. Defaults to the
+              number of CPUs.
+
+    copy - True to copy each image out of the shared memory block that the
+           worker put it in, and free the block, returning ordinary arrays.
+           False to return a :class:`SharedImages` list of arrays that are
+           views of the blocks, which saves the copy; call its
+           :meth:`SharedImages.release` method to free the blocks.
+
+    Returns a list of the images in the order of `paths`. Requires
+    Python 3.8 or later, for :mod:`multiprocessing.shared_memory`.
+    '''
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ImportError(
+            "bioformats.parallel.load_images needs "
+            "multiprocessing.shared_memory, which is new in Python 3.8")
+    paths = list(paths)
+    kwargs = dict(c=c, z=z, t=t, series=series, index=index, rescale=rescale)
+    #
+    # Name the blocks here, so that the blocks of images that were never
+    # received can still be unlinked if loading fails.
+    #
+    prefix = "bf_%s_" % uuid.uuid4().hex[:12]
+    names = [prefix + str(i) for i in range(len(paths))]
+    images = [] if copy else SharedImages()
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(workers, initializer=start_worker_vm)
+    try:
+        for name, (shape, dtype) in zip(names, pool.imap(
+                load_image_into_shared_memory,
+                [(path, kwargs, name) for path, name in zip(paths, names)])):
+            block = shared_memory.SharedMemory(name=name)
+            image = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            if copy:
+                try:
+                    images.append(image.copy())
+                finally:
+                    del image
+                    block.close()
+                    block.unlink()
+            else:
+                images.blocks.append(block)
+                images.append(image)
+        pool.close()
+        pool.join()
+    except:
+        pool.terminate()
+        pool.join()
+        if not copy:
+            images.release()
+        for name in names[len(images):]:
+            unlink_shared_memory(name)
+        raise
+    return images
@@ -0,0 +1,100 @@
+# Python-bioformats is distributed under the GNU General Public
+# License, but this file is licensed under the more permissive BSD
+# license.  See the accompanying file LICENSE for details.
+#
+# Copyright (c) 2009-2014 Broad Institute
+# All rights reserved.
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import os
+import sys
+import unittest
+
+import javabridge
+import bioformats
+
+@unittest.skipIf(sys.version_info < (3, 5), "bioformats.aio needs Python 3.5")
+class TestAsyncImageReader(unittest.TestCase):
+
+    def setUp(self):
+        javabridge.attach()
+        bioformats.init_logger()
+        self.path = os.path.join(os.path.dirname(__file__),
+                                 'Channel1-01-A-01.tif')
+
+    def tearDown(self):
+        javabridge.detach()
+
+    def run_coroutine(self, coroutine):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_01_01_read(self):
+        import asyncio
+        import bioformats.aio
+        expected = bioformats.load_image(self.path, rescale=False)
+        pool = bioformats.aio.JVMThreadPool(max_workers=2, max_pending=2)
+        rdr = bioformats.aio.AsyncImageReader(self.path, pool=pool)
+        try:
+            self.assertIs(self.run_coroutine(rdr.open()), rdr)
+            image = self.run_coroutine(rdr.read(rescale=False))
+            self.assertTrue(np.all(image == expected))
+            tile = self.run_coroutine(rdr.read_tile(10, 20, 30, 40,
+                                                    rescale=False))
+            self.assertTrue(np.all(tile == expected[20:60, 10:40]))
+            xml = self.run_coroutine(rdr.get_omexml_metadata())
+            self.assertEqual(
+                bioformats.OMEXML(xml).image().Pixels.SizeX, expected.shape[1])
+            with open(self.path, "rb") as fd:
+                data = fd.read()
+            data_rdr = bioformats.aio.AsyncImageReader(data=data, pool=pool)
+            try:
+                xml = self.run_coroutine(data_rdr.get_omexml_metadata())
+                self.assertEqual(bioformats.OMEXML(xml).image().Pixels.SizeX,
+                                 expected.shape[1])
+            finally:
+                self.run_coroutine(data_rdr.close())
+            images = self.run_coroutine(asyncio.gather(*[
+                bioformats.aio.read_image(self.path, pool=pool, rescale=False)
+                for _ in range(4)]))
+            for image in images:
+                self.assertTrue(np.all(image == expected))
+            self.run_coroutine(rdr.close())
+            self.assertIsNone(rdr.rdr)
+        finally:
+            pool.shutdown()
+
+    def test_01_02_cancel(self):
+        import asyncio
+        import threading
+        import bioformats.aio
+        pool = bioformats.aio.JVMThreadPool(max_workers=1)
+        event = threading.Event()
+        calls = []
+        def fn(i):
+            event.wait()
+            calls.append(i)
+            return i
+
+        async def main():
+            tasks = [asyncio.ensure_future(pool.run(fn, i)) for i in range(3)]
+            await asyncio.sleep(.1)
+            tasks[1].cancel()
+            await asyncio.sleep(.1)
+            event.set()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            self.assertEqual(results[0], 0)
+            self.assertIsInstance(results[1], asyncio.CancelledError)
+            self.assertEqual(results[2], 2)
+
+        try:
+            self.run_coroutine(main())
+            self.assertEqual(calls, [0, 2])
+        finally:
+            pool.shutdown()
@@ -11,20 +11,71 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import contextlib
 import numpy as np
 import os
 import re
+import shutil
 import sys
+import tempfile
+import threading
+import time
 if sys.version_info.major == 2:
     from urllib import urlopen
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from StringIO import StringIO as BytesIO
 else:
     from urllib.request import urlopen
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from io import BytesIO
 import unittest
 
 import javabridge as J
 import bioformats.formatreader as F
 import bioformats
 
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    '''Serve the files in the test directory, honoring range requests'''
+    def translate_path(self, path):
+        return os.path.join(os.path.dirname(__file__), path.lstrip("/"))
+
+    def send_head(self):
+        match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range") or "")
+        if match is None:
+            return SimpleHTTPRequestHandler.send_head(self)
+        with open(self.translate_path(self.path), "rb") as fd:
+            data = fd.read()
+        start = int(match.group(1))
+        stop = min(int(match.group(2)) + 1, len(data))
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range",
+                         "bytes %d-%d/%d" % (start, stop - 1, len(data)))
+        self.send_header("Content-Length", str(stop - start))
+        self.end_headers()
+        return BytesIO(data[start:stop])
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def serve_test_directory():
+    '''Serve the test directory over HTTP while the block runs
+
+    Yields the URL of the directory.
+    '''
+    server = HTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield "http://127.0.0.1:%d/" % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
 class TestFormatReader(unittest.TestCase):
     def setUp(self):
         J.start_vm(class_path=bioformats.JARS)
@@ -47,6 +98,18 @@ class TestFormatReader(unittest.TestCase):
         self.assertEqual(FormatTools.UINT32, 5)
         self.assertEqual(FormatTools.UINT8, 1)
 
+    def test_01_02_binding_cache(self):
+        FormatTools = F.make_format_tools_class()
+        self.assertTrue(F.make_format_tools_class() is FormatTools)
+        ChannelSeparator = F.make_reader_wrapper_class(
+            "loci/formats/ChannelSeparator")
+        self.assertTrue(F.make_reader_wrapper_class(
+            "loci/formats/ChannelSeparator") is ChannelSeparator)
+        self.assertFalse(F.make_reader_wrapper_class(
+            "loci/formats/DimensionSwapper") is ChannelSeparator)
+        F.clear_binding_cache()
+        self.assertFalse(F.make_format_tools_class() is FormatTools)
+
     def test_02_01_make_image_reader(self):
         path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
         ImageReader = F.make_image_reader_class()
@@ -175,10 +238,478 @@ class TestFormatReader(unittest.TestCase):
         data = F.load_using_bioformats_url(url, rescale=False)
         self.assertSequenceEqual(data.shape, (640, 640))
 
+    def test_03_04_stream_url(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with F.ImageReader(path) as rdr:
+            expected = rdr.read(rescale=False)
+        with serve_test_directory() as directory_url:
+            url = directory_url + "Channel1-01-A-01.tif"
+            with F.ImageReader(url=url, stream_url=True) as rdr:
+                self.assertFalse(rdr.using_temp_file)
+                range_reader = rdr.url_handle.range_reader
+                self.assertEqual(range_reader.size, os.path.getsize(path))
+                data = rdr.read(rescale=False, XYWH=(0, 0, 640, 10))
+                self.assertTrue(np.all(data == expected[:10]))
+                data = rdr.read(rescale=False)
+                self.assertTrue(np.all(data == expected))
+
+    def test_03_05_url_range_reader(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with open(path, "rb") as fd:
+            expected = fd.read()
+        with serve_test_directory() as directory_url:
+            url = directory_url + "Channel1-01-A-01.tif"
+            reader = F.URLRangeReader(url, block_size=1000, max_blocks=4)
+            self.assertEqual(reader.n_requests, 1)
+            self.assertEqual(reader.read(10, 20), expected[10:30])
+            self.assertEqual(reader.n_requests, 1)
+            self.assertEqual(reader.read(50500, 2000), expected[50500:52500])
+            self.assertEqual(reader.n_requests, 2)
+            self.assertEqual(reader.n_bytes_fetched, 4000)
+            self.assertEqual(reader.read(len(expected) - 5, 100),
+                             expected[-5:])
+
+    def test_03_06_download_cache(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with F.ImageReader(path) as rdr:
+            expected = rdr.read(rescale=False)
+        directory = tempfile.mkdtemp()
+        try:
+            F.enable_download_cache(directory, 10000000)
+            with serve_test_directory() as directory_url:
+                url = directory_url + "Channel1-01-A-01.tif"
+                with F.ImageReader(url=url) as rdr:
+                    self.assertFalse(rdr.using_temp_file)
+                    cached_path = rdr.path
+                    self.assertTrue(
+                        cached_path.endswith("Channel1-01-A-01.tif"))
+                    self.assertTrue(
+                        np.all(rdr.read(rescale=False) == expected))
+                self.assertTrue(os.path.isfile(cached_path))
+                with F.ImageReader(url=url) as rdr:
+                    self.assertEqual(rdr.path, cached_path)
+                F.get_download_cache().clear()
+                self.assertFalse(os.path.exists(cached_path))
+        finally:
+            F.disable_download_cache()
+            shutil.rmtree(directory)
+
+    def test_03_07_read_bytes(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with F.ImageReader(path) as rdr:
+            expected = rdr.read(rescale=False)
+        with open(path, "rb") as fd:
+            data = fd.read()
+        with F.ImageReader(path=path, data=data) as rdr:
+            self.assertFalse(rdr.using_temp_file)
+            self.assertNotEqual(rdr.path, path)
+            self.assertTrue(np.all(rdr.read(rescale=False) == expected))
+        self.assertIsNone(rdr.mapped_id)
+        with F.ImageReader(data=bytearray(data)) as rdr:
+            self.assertTrue(np.all(rdr.read(rescale=False) == expected))
+
+    def test_03_08_disk_cache_put_failure(self):
+        class FailingFile(object):
+            def read(self, n=-1):
+                raise IOError("read failed")
+        directory = tempfile.mkdtemp()
+        try:
+            cache = F.DiskCache(directory, 10000000)
+            self.assertRaises(IOError, cache.put, "key", FailingFile())
+            self.assertEqual(os.listdir(directory), [])
+            self.assertIsNone(cache.get_path("key"))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_03_09_disk_cache_in_use(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = F.DiskCache(directory, 25)
+            path = cache.put("in use", b"x" * 10, acquire=True)
+            cache.put("idle", b"y" * 10)
+            cache.put("new", b"z" * 10)
+            # The idle entry is evicted rather than the one in use
+            self.assertIsNone(cache.get_path("idle"))
+            self.assertEqual(cache.get_path("in use"), path)
+            cache.clear()
+            self.assertTrue(os.path.isfile(path))
+            cache.remove("in use")
+            self.assertIsNone(cache.get_path("in use"))
+            self.assertTrue(os.path.isfile(path))
+            cache.release(path)
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(directory)
+
     def test_04_01_read_omexml_metadata(self):
         path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
         xml = F.get_omexml_metadata(path)
         pattern = r'<\s*Image\s+ID\s*=\s*"Image:0"\s+Name\s*=\s*"Channel1-01-A-01.tif"\s*>'
         self.assertTrue(re.search(pattern, xml))
 
+    def test_04_02_get_omexml_and_reader(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with F.ImageReader(path) as rdr:
+            expected = rdr.read(rescale=False)
+            metadata = rdr.get_omexml()
+        self.assertEqual(metadata.image().Name, "Channel1-01-A-01.tif")
+        self.assertEqual(metadata.image().Pixels.SizeX, 640)
+        metadata, rdr = F.get_omexml_and_reader(path)
+        try:
+            self.assertEqual(metadata.image().Pixels.SizeY, 640)
+            self.assertTrue(np.all(rdr.read(rescale=False) == expected))
+        finally:
+            rdr.close()
+        with F.ImageReader(path, omexml_metadata=False) as rdr:
+            self.assertRaises(ValueError, rdr.get_omexml)
+
+    def test_04_03_omexml_cache(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        expected = F.get_omexml_metadata(path)
+        directory = tempfile.mkdtemp()
+        try:
+            cache = F.enable_omexml_cache(directory, 10000000)
+            self.assertEqual(F.get_omexml_metadata(path), expected)
+            key = F.get_omexml_cache_key(path)
+            cached_path = cache.get_path(key)
+            self.assertTrue(os.path.isfile(cached_path))
+            with open(cached_path, "wb") as fd:
+                fd.write("<OME/>".encode("utf-8"))
+            self.assertEqual(F.get_omexml_metadata(path), "<OME/>")
+            cache.clear()
+            self.assertEqual(F.get_omexml_metadata(path), expected)
+        finally:
+            F.disable_omexml_cache()
+            shutil.rmtree(directory)
+
+    def test_05_01_reader_detection_cache(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        F.clear_reader_detection_cache()
+        with F.ImageReader(path) as rdr:
+            class_name = rdr.rdr.get_class_name()
+        stats = F.get_reader_detection_cache_stats()
+        self.assertEqual(stats["hits"], 0)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+        with F.ImageReader(path) as rdr:
+            self.assertEqual(rdr.rdr.get_class_name(), class_name)
+            data = rdr.read(rescale=False)
+        self.assertSequenceEqual(data.shape, (640, 640))
+        stats = F.get_reader_detection_cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        #
+        # The TIFF reader is near the end of the class list, but a hit
+        # only instantiates it and the classes before it that read TIFFs
+        #
+        n_classes = int(J.run_script(
+            "class_list.getClasses().length",
+            dict(class_list = F.get_class_list())))
+        self.assertTrue(0 < stats["hit_instances"] < n_classes / 2)
+        #
+        # A cached class that doesn't claim the file falls back to the scan
+        #
+        cache = getattr(F, "__reader_class_cache")
+        for key in list(cache.keys()):
+            cache[key] = ("loci.formats.in.APNGReader", ())
+        with F.ImageReader(path) as rdr:
+            self.assertEqual(rdr.rdr.get_class_name(), class_name)
+        stats = F.get_reader_detection_cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual([name for name, rival_names in cache.values()],
+                         [class_name])
+
+    def test_05_02_plane_cache(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        cache = F.PlaneCache(640 * 640 + 50)
+        with F.ImageReader(path, plane_cache=cache) as rdr:
+            expected = rdr.read(rescale=False)
+            data = rdr.read(rescale=False)
+            self.assertTrue(np.all(data == expected))
+            self.assertTrue(expected.flags.writeable)
+            self.assertTrue(data.flags.writeable)
+            stats = cache.get_stats()
+            self.assertEqual(stats["hits"], 1)
+            self.assertEqual(stats["misses"], 1)
+            self.assertEqual(stats["n_bytes"], 640 * 640)
+            region = rdr.read(rescale=False, XYWH=(0, 0, 10, 10))
+            self.assertTrue(np.all(region == expected[:10, :10]))
+            self.assertEqual(cache.get_stats()["evictions"], 1)
+            with F.ImageReader(path, plane_cache=cache,
+                               flatten_resolutions=False) as other:
+                # Series are numbered differently, so planes aren't shared
+                other.read(rescale=False, XYWH=(0, 0, 10, 10))
+                self.assertEqual(cache.get_stats()["misses"], 3)
+        self.assertEqual(len(cache), 0)
+        #
+        # Closing a reader only removes its own file's planes
+        #
+        directory = tempfile.mkdtemp()
+        try:
+            copy_path = os.path.join(directory, os.path.basename(path))
+            shutil.copy(path, copy_path)
+            cache = F.PlaneCache(2 * 640 * 640)
+            with F.ImageReader(path, plane_cache=cache) as rdr:
+                rdr.read(rescale=False)
+                with F.ImageReader(copy_path, plane_cache=cache) as other:
+                    other.read(rescale=False)
+                    self.assertEqual(len(cache), 2)
+                self.assertEqual(len(cache), 1)
+                rdr.read(rescale=False)
+                self.assertEqual(cache.get_stats()["hits"], 1)
+            self.assertEqual(len(cache), 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_05_03_memoizer(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        directory = tempfile.mkdtemp()
+        try:
+            F.enable_memoizer(directory, minimum_elapsed=0)
+            with F.ImageReader(path) as rdr:
+                self.assertFalse(rdr.is_loaded_from_memo())
+                expected = rdr.read(rescale=False)
+            with F.ImageReader(path) as rdr:
+                self.assertTrue(rdr.is_loaded_from_memo())
+                self.assertTrue(np.all(rdr.read(rescale=False) == expected))
+            with F.ImageReader(path, memoize=False) as rdr:
+                self.assertFalse(rdr.is_loaded_from_memo())
+        finally:
+            F.disable_memoizer()
+            shutil.rmtree(directory)
 
+    def test_05_04_image_reader_cache(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        directory = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(directory, "%d.tif" % i) for i in range(3)]
+            for copy_path in paths:
+                shutil.copy(path, copy_path)
+            F.clear_image_reader_cache()
+            F.set_image_reader_cache_limits(max_readers=2, max_open_files=1)
+            rdr = F.get_image_reader("A", paths[0])
+            self.assertTrue(F.get_image_reader("A", paths[0]) is rdr)
+            F.release_image_reader("A")
+            self.assertTrue(F.get_image_reader("B", paths[0]) is rdr)
+            for i, copy_path in enumerate(paths):
+                F.get_image_reader("C%d" % i, copy_path)
+                F.release_image_reader("C%d" % i)
+            stats = F.get_image_reader_cache_stats()
+            self.assertEqual(stats["hits"], 3)
+            self.assertEqual(stats["misses"], 3)
+            self.assertEqual(stats["evictions"], 1)
+            self.assertEqual(stats["size"], 2)
+            self.assertEqual(stats["idle"], 1)
+            self.assertEqual(stats["open_files"], 1)
+            F.release_image_reader("B")
+            rdr = F.get_image_reader("D", paths[1])
+            self.assertEqual(rdr.read(rescale=False).shape, (640, 640))
+        finally:
+            F.clear_image_reader_cache()
+            F.set_image_reader_cache_limits()
+            shutil.rmtree(directory)
+
+    def test_05_05_image_reader_cache_threads(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        F.clear_image_reader_cache()
+        readers = []
+        def fn(key):
+            J.attach()
+            try:
+                readers.append(F.get_image_reader(key, path))
+            finally:
+                J.detach()
+        threads = [threading.Thread(target=fn, args=("K%d" % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            self.assertEqual(len(readers), 4)
+            self.assertTrue(all([rdr is readers[0] for rdr in readers]))
+            stats = F.get_image_reader_cache_stats()
+            self.assertEqual(stats["misses"], 1)
+            self.assertEqual(stats["hits"], 3)
+        finally:
+            F.clear_image_reader_cache()
+
+    def test_06_01_read_stack(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            stack = f.read_stack(rescale=False)
+            expected = f.read(rescale=False)
+            self.assertSequenceEqual(stack.shape, (1, 1, 1, 640, 640))
+            self.assertTrue(np.all(stack[0, 0, 0] == expected))
+            stack = f.read_stack(z=0, c=[0], t=range(1), XYWH=(0, 0, 10, 10))
+            self.assertSequenceEqual(stack.shape, (1, 1, 1, 10, 10))
+            self.assertEqual(stack.dtype, np.float32)
+            self.assertTrue(np.all(
+                np.abs(stack[0, 0, 0] - expected[:10, :10] / 255.0) < 1e-6))
+            out = np.zeros((1, 1, 1, 10, 10), np.uint8)
+            self.assertRaises(TypeError, f.read_stack,
+                              XYWH=(0, 0, 10, 10), out=out)
+            self.assertRaises(TypeError, f.read,
+                              XYWH=(0, 0, 10, 10), out=out[0, 0, 0])
+            stack = f.read_stack(XYWH=(0, 0, 10, 10), out=out, rescale=False)
+            self.assertIs(stack, out)
+            self.assertTrue(np.all(out[0, 0, 0] == expected[:10, :10]))
+
+    def test_06_02_read_into_out(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read()
+            volume = np.zeros((2, 640, 640), np.float32)
+            result = f.read(out=volume[1])
+            self.assertTrue(np.all(volume[1] == expected))
+            self.assertTrue(np.all(result == expected))
+            self.assertTrue(np.all(volume[0] == 0))
+            raw = np.zeros((10, 10), np.uint8)
+            f.read(rescale=False, XYWH=(0, 0, 10, 10), out=raw)
+            self.assertTrue(np.all(raw == f.read(rescale=False)[:10, :10]))
+            self.assertRaises(ValueError, f.read, out=np.zeros((10, 10)))
+
+    def test_06_03_open_bytes_into_buffer(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+            for _ in range(2):
+                data = f.open_bytes(f.rdr, 0, 640 * 640)
+                self.assertTrue(np.all(data.reshape(640, 640) == expected))
+            data = f.open_bytes(f.rdr, 0, 100, (0, 0, 10, 10))
+            self.assertTrue(np.all(data.reshape(10, 10) == expected[:10, :10]))
+
+    def test_06_04_iter_tiles(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+            result = np.zeros(expected.shape, expected.dtype)
+            for x, y, tile in f.iter_tiles(tile_shape=(300, 250), rescale=False):
+                self.assertTrue(tile.shape[0] <= 300)
+                self.assertTrue(tile.shape[1] <= 250)
+                result[y:y+tile.shape[0], x:x+tile.shape[1]] = tile
+            self.assertTrue(np.all(result == expected))
+            n_tiles = len(list(f.iter_tiles()))
+            self.assertTrue(n_tiles >= 1)
+
+    def test_06_05_resolutions(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path, flatten_resolutions=False) as f:
+            self.assertEqual(f.get_resolution_count(), 1)
+            self.assertEqual(f.get_resolution_dimensions(), [(640, 640)])
+            self.assertEqual(f.get_resolution_count(series=0), 1)
+            self.assertEqual(f.get_resolution_dimensions(series=0),
+                             [(640, 640)])
+            self.assertEqual(f.rdr.getSeries(), 0)
+            self.assertEqual(f.rdr.getResolution(), 0)
+            data = f.read(resolution=0, rescale=False)
+            self.assertSequenceEqual(data.shape, (640, 640))
+
+    def test_06_06_as_array(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            arr = f.as_array()
+            self.assertSequenceEqual(arr.shape, (1, 1, 1, 640, 640))
+            self.assertEqual(arr.ndim, 5)
+            self.assertEqual(arr.dtype, np.uint8)
+            expected = f.read(rescale=False)
+            region = arr[0, 0, 0, 100:200, 300:350]
+            self.assertSequenceEqual(region.shape, (100, 50))
+            self.assertTrue(np.all(region == expected[100:200, 300:350]))
+            strided = arr[..., 10:90:3, ::-7]
+            self.assertSequenceEqual(strided.shape, (1, 1, 1, 27, 92))
+            self.assertTrue(np.all(strided[0, 0, 0] == expected[10:90:3, ::-7]))
+            self.assertTrue(np.all(np.asarray(arr)[0, 0, 0] == expected))
+            self.assertRaises(IndexError, lambda: arr[1])
+
+    def test_06_07_reader_pool(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+        with F.ImageReaderPool(path, max_readers=2) as pool:
+            images = pool.read_many([dict(rescale=False)] * 6)
+            self.assertEqual(len(images), 6)
+            for image in images:
+                self.assertTrue(np.all(image == expected))
+            self.assertTrue(1 <= pool.get_reader_count() <= 2)
+            reader = pool.acquire()
+            self.assertTrue(np.all(reader.read(rescale=False) == expected))
+            pool.release(reader)
+        self.assertEqual(pool.get_reader_count(), 0)
+        self.assertRaises(ValueError, pool.acquire)
+        #
+        # Idle readers are closed once they time out, with no further calls
+        #
+        with F.ImageReaderPool(path, max_readers=2, idle_timeout=.1) as pool:
+            pool.read_many([dict(rescale=False)] * 4)
+            self.assertTrue(pool.get_reader_count() > 0)
+            deadline = time.time() + 10
+            while pool.get_reader_count() > 0 and time.time() < deadline:
+                time.sleep(.05)
+            self.assertEqual(pool.get_reader_count(), 0)
+
+    def test_06_08_geometry(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            geometry = f.get_geometry()
+            self.assertEqual(geometry.series, 0)
+            self.assertEqual(geometry.resolution, 0)
+            self.assertEqual(geometry.dtype, np.uint8)
+            self.assertEqual(geometry.scale, 255)
+            self.assertEqual((geometry.size_x, geometry.size_y), (640, 640))
+            self.assertEqual(geometry.rgb_channel_count, 1)
+            self.assertTrue(f.get_geometry(series=0) is geometry)
+
+    def test_06_09_prefetch(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+            self.assertIsNone(f.get_prefetch_stats())
+            plan = [dict(rescale=False, XYWH=(0, y, 640, 64))
+                    for y in range(0, 640, 64)]
+            f.enable_prefetch(depth=2, plan=plan)
+            for kwargs in plan:
+                y = kwargs["XYWH"][1]
+                tile = f.read(**kwargs)
+                self.assertTrue(np.all(tile == expected[y:y+64]))
+            stats = f.get_prefetch_stats()
+            self.assertEqual(stats["depth"], 2)
+            self.assertEqual(stats["hits"] + stats["misses"], len(plan))
+            self.assertEqual(stats["hits"], stats["prefetched"])
+            self.assertEqual(stats["size"], 0)
+            f.disable_prefetch()
+            self.assertIsNone(f.get_prefetch_stats())
+
+    def test_06_10_reader_pipeline(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+        missing = os.path.join(os.path.dirname(__file__), 'missing.tif')
+        paths = [path, path, missing, path]
+        with bioformats.ImageReaderPipeline(paths, lookahead=2) as pipeline:
+            readers = []
+            for i in range(2):
+                reader = pipeline.next_reader()
+                self.assertTrue(np.all(reader.read(rescale=False) == expected))
+                readers.append(reader)
+            self.assertFalse(hasattr(readers[0], "rdr"))
+            self.assertRaises(IOError, pipeline.next_reader)
+            reader = pipeline.next_reader()
+            self.assertTrue(np.all(reader.read(rescale=False) == expected))
+            self.assertIsNone(pipeline.next_reader())
+        self.assertFalse(hasattr(reader, "rdr"))
+
+    def test_06_11_metadata_level(self):
+        from bioformats import metadatatools
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        with bioformats.ImageReader(path) as f:
+            expected = f.read(rescale=False)
+            self.assertIsNotNone(f.metadata)
+        with bioformats.ImageReader(
+                path, metadata_level=metadatatools.MINIMUM,
+                omexml_metadata=False) as f:
+            self.assertIsNone(f.metadata)
+            self.assertTrue(np.all(f.read(rescale=False) == expected))
+        self.assertRaises(ValueError, bioformats.ImageReader, path,
+                          metadata_level="EVERYTHING")
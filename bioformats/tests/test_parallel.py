@@ -0,0 +1,73 @@
+# Python-bioformats is distributed under the GNU General Public
+# License, but this file is licensed under the more permissive BSD
+# license.  See the accompanying file LICENSE for details.
+#
+# Copyright (c) 2009-2014 Broad Institute
+# All rights reserved.
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import os
+import sys
+import threading
+import unittest
+
+import javabridge
+import bioformats
+import bioformats.parallel
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        javabridge.attach()
+        bioformats.init_logger()
+
+    def tearDown(self):
+        javabridge.detach()
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     "multiprocessing.shared_memory is new in Python 3.8")
+    def test_01_01_load_images(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        expected = bioformats.load_image(path, rescale=False)
+        images = bioformats.parallel.load_images(
+            [path] * 3, rescale=False, workers=2)
+        self.assertEqual(len(images), 3)
+        for image in images:
+            self.assertEqual(image.dtype, expected.dtype)
+            self.assertTrue(np.all(image == expected))
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     "multiprocessing.shared_memory is new in Python 3.8")
+    def test_01_02_workers_exit(self):
+        #
+        # Each worker starts a real Java VM, and load_images only returns
+        # once the workers have killed their VMs and exited.
+        #
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            bioformats.parallel.load_images([path] * 2, workers=2)))
+        thread.daemon = True
+        thread.start()
+        thread.join(300)
+        self.assertFalse(thread.is_alive(), "The worker processes hung")
+        self.assertEqual(len(results[0]), 2)
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     "multiprocessing.shared_memory is new in Python 3.8")
+    def test_01_03_load_images_shared(self):
+        path = os.path.join(os.path.dirname(__file__), 'Channel1-01-A-01.tif')
+        expected = bioformats.load_image(path, rescale=False)
+        with bioformats.parallel.load_images(
+                [path] * 2, rescale=False, workers=1, copy=False) as images:
+            self.assertEqual(len(images), 2)
+            self.assertEqual(len(images.blocks), 2)
+            for image in images:
+                self.assertTrue(np.all(image == expected))
+            del image
+        self.assertEqual(len(images), 0)
+        self.assertRaises(IOError, bioformats.parallel.load_images,
+                          [path, os.path.join(os.path.dirname(__file__),
+                                              'missing.tif')], workers=1)